@@ -1,84 +1,189 @@
+import hashlib
+import os
+import time
 import pandas as pd
 import sqlite3
 import matplotlib.pyplot as plt
 import seaborn as sns
+from concurrent.futures import ProcessPoolExecutor
 from textblob import TextBlob
 
+from data_processing import DESCRIPTION_PLACEHOLDER
+
+DB_PATH = "books.db"
+
+# Descriptions scored per worker task; large enough that pickling a batch
+# costs little next to scoring it.
+SENTIMENT_BATCH_SIZE = 2_000
+
+# Worker processes for sentiment scoring (None = one per CPU core, 0 = score in this process).
+SENTIMENT_WORKERS = None if os.environ.get("SENTIMENT_WORKERS") is None else int(os.environ["SENTIMENT_WORKERS"])
+
+# Polarity per description, keyed by a hash of its text: a rerun scores only
+# descriptions it has not seen, and books sharing a description share a row.
+# The table lives in its own file next to books.db, so storing scores never
+# changes the database hash that the API and the dashboard refit on.
+SENTIMENT_DB_PATH = os.path.join(os.path.dirname(DB_PATH), "sentiment.db")
+SENTIMENT_TABLE = 'DescriptionSentiment'
+
 # Set a style for the plots
 sns.set_style('whitegrid')
 
+
 # --- Part 1: Load Data from the Database ---
-print("Connecting to books.db...")
-try:
-    # Connect to the SQLite database
-    conn = sqlite3.connect("books.db")
 
-    # Load the entire 'Books' table into a Pandas DataFrame
-    books_df = pd.read_sql_query("SELECT * FROM Books", conn)
+def load_books(db_path=DB_PATH):
+    print(f"Connecting to {db_path}...")
+    try:
+        # Connect to the SQLite database
+        conn = sqlite3.connect(db_path)
+
+        # Load the entire 'Books' table into a Pandas DataFrame
+        books_df = pd.read_sql_query("SELECT * FROM Books", conn)
 
-    # Close the database connection
-    conn.close()
+        # Close the database connection
+        conn.close()
 
-    print(f"Data loaded from database. Total books: {len(books_df)}")
+        print(f"Data loaded from database. Total books: {len(books_df)}")
+        return books_df
+
+    except sqlite3.OperationalError as e:
+        print(f"Error: {e}. Make sure you have run data_processing.py first to create the books.db file.")
+        exit()
 
-except sqlite3.OperationalError as e:
-    print(f"Error: {e}. Make sure you have run data_processing.py first to create the books.db file.")
-    exit()
 
 # --- Part 2: Create Charts for Bestseller Trends ---
-print("\nGenerating bestseller analysis charts...")
-
-# --- Chart 1: Top 10 Bestselling Genres ---
-# Count the occurrences of each genre
-top_genres = books_df['genre'].value_counts().head(10)
-
-# Create a bar chart using Seaborn
-plt.figure(figsize=(12, 7))
-sns.barplot(x=top_genres.values, y=top_genres.index, palette='viridis')
-plt.title('Top 10 Bestselling Book Genres', fontsize=18, fontweight='bold')
-plt.xlabel('Number of Books', fontsize=14)
-plt.ylabel('Genre', fontsize=14)
-plt.show()
-
-# --- Chart 2: Top 10 Bestselling Authors ---
-# Count the occurrences of each author
-top_authors = books_df['author'].value_counts().head(10)
-
-# Create a bar chart
-plt.figure(figsize=(12, 7))
-sns.barplot(x=top_authors.values, y=top_authors.index, palette='magma')
-plt.title('Top 10 Bestselling Authors', fontsize=18, fontweight='bold')
-plt.xlabel('Number of Bestsellers', fontsize=14)
-plt.ylabel('Author', fontsize=14)
-plt.show()
-
-# --- Chart 3: Distribution of Ratings ---
-# Create a histogram for ratings
-plt.figure(figsize=(12, 7))
-sns.histplot(books_df['rating'], bins=20, kde=True, color='skyblue')
-plt.title('Distribution of Bestseller Ratings', fontsize=18, fontweight='bold')
-plt.xlabel('Rating', fontsize=14)
-plt.ylabel('Number of Books', fontsize=14)
-plt.show()
-
-# --- Part 3: Perform Sentiment Analysis on Descriptions (Optional) ---
-print("\nPerforming sentiment analysis on book descriptions...")
-
-# A function to get sentiment polarity
-def get_sentiment(text):
-    if isinstance(text, str):
-        return TextBlob(text).sentiment.polarity
-    return 0
-
-# Apply the function to the 'description' column
-books_df['description_sentiment'] = books_df['description'].apply(get_sentiment)
-
-# Visualize the sentiment distribution
-plt.figure(figsize=(12, 7))
-sns.histplot(books_df['description_sentiment'], bins=20, kde=True, color='lightgreen')
-plt.title('Sentiment Polarity of Book Descriptions', fontsize=18, fontweight='bold')
-plt.xlabel('Sentiment Polarity (-1.0 to 1.0)', fontsize=14)
-plt.ylabel('Number of Books', fontsize=14)
-plt.show()
-
-print("\nAnalysis complete. All charts have been generated.")
\ No newline at end of file
+
+def plot_bestseller_trends(books_df):
+    print("\nGenerating bestseller analysis charts...")
+
+    # --- Chart 1: Top 10 Bestselling Genres ---
+    # Count the occurrences of each genre
+    top_genres = books_df['genre'].value_counts().head(10)
+
+    # Create a bar chart using Seaborn
+    plt.figure(figsize=(12, 7))
+    sns.barplot(x=top_genres.values, y=top_genres.index, palette='viridis')
+    plt.title('Top 10 Bestselling Book Genres', fontsize=18, fontweight='bold')
+    plt.xlabel('Number of Books', fontsize=14)
+    plt.ylabel('Genre', fontsize=14)
+    plt.show()
+
+    # --- Chart 2: Top 10 Bestselling Authors ---
+    # Count the occurrences of each author
+    top_authors = books_df['author'].value_counts().head(10)
+
+    # Create a bar chart
+    plt.figure(figsize=(12, 7))
+    sns.barplot(x=top_authors.values, y=top_authors.index, palette='magma')
+    plt.title('Top 10 Bestselling Authors', fontsize=18, fontweight='bold')
+    plt.xlabel('Number of Bestsellers', fontsize=14)
+    plt.ylabel('Author', fontsize=14)
+    plt.show()
+
+    # --- Chart 3: Distribution of Ratings ---
+    # Create a histogram for ratings
+    plt.figure(figsize=(12, 7))
+    sns.histplot(books_df['rating'], bins=20, kde=True, color='skyblue')
+    plt.title('Distribution of Bestseller Ratings', fontsize=18, fontweight='bold')
+    plt.xlabel('Rating', fontsize=14)
+    plt.ylabel('Number of Books', fontsize=14)
+    plt.show()
+
+
+# --- Part 3: Sentiment Analysis on Descriptions ---
+
+def has_description(text):
+    """False for missing, blank and placeholder descriptions, which are not scored."""
+    return isinstance(text, str) and text.strip() != '' and text.strip() != DESCRIPTION_PLACEHOLDER
+
+
+def content_hash(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def score_batch(texts):
+    """Sentiment polarity of each text; runs in a worker process."""
+    return [TextBlob(text).sentiment.polarity for text in texts]
+
+
+def score_texts(texts, batch_size=SENTIMENT_BATCH_SIZE, max_workers=SENTIMENT_WORKERS):
+    """Scores `texts` in batches, over a process pool unless max_workers is 0 or there is one batch."""
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    if max_workers == 0 or len(batches) <= 1:
+        return [score for batch in batches for score in score_batch(batch)]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return [score for scores in pool.map(score_batch, batches) for score in scores]
+
+
+def update_sentiment(books_df, db_path=SENTIMENT_DB_PATH, batch_size=SENTIMENT_BATCH_SIZE,
+                     max_workers=SENTIMENT_WORKERS):
+    """
+    Returns the description polarity of every book (NaN where there is no
+    description to score). Polarities are stored in the DescriptionSentiment
+    table of sentiment.db, so only new or changed descriptions are scored,
+    and entries no longer used by any book are removed.
+    """
+    descriptions = books_df['description'].tolist()
+    hashes = [content_hash(text) if has_description(text) else None for text in descriptions]
+
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SENTIMENT_TABLE}(
+            content_hash TEXT PRIMARY KEY,
+            description_sentiment REAL
+        ) WITHOUT ROWID
+        """)
+        stored = dict(conn.execute(f"SELECT content_hash, description_sentiment FROM {SENTIMENT_TABLE}"))
+
+        # Score each new description once, however many books share it
+        pending = {}
+        for key, text in zip(hashes, descriptions):
+            if key is not None and key not in stored and key not in pending:
+                pending[key] = text
+        start = time.perf_counter()
+        scores = dict(zip(pending, score_texts(list(pending.values()), batch_size, max_workers)))
+        if pending:
+            print(f"Scored {len(pending)} new descriptions in {time.perf_counter() - start:.1f}s "
+                  f"({len(stored)} already stored).")
+        else:
+            print(f"All {len(stored)} description sentiments are up to date.")
+
+        unused = stored.keys() - set(hashes)
+        if scores or unused:
+            with conn:
+                conn.executemany(f"INSERT OR REPLACE INTO {SENTIMENT_TABLE} VALUES (?, ?)", scores.items())
+                conn.executemany(f"DELETE FROM {SENTIMENT_TABLE} WHERE content_hash = ?",
+                                 [(key,) for key in unused])
+        stored.update(scores)
+    finally:
+        conn.close()
+
+    return pd.Series([stored.get(key) for key in hashes], index=books_df.index, dtype=float)
+
+
+def plot_sentiment(books_df):
+    print("\nPerforming sentiment analysis on book descriptions...")
+
+    books_df['description_sentiment'] = update_sentiment(books_df)
+
+    # Visualize the sentiment distribution (books without a description are left out)
+    plt.figure(figsize=(12, 7))
+    sns.histplot(books_df['description_sentiment'].dropna(), bins=20, kde=True, color='lightgreen')
+    plt.title('Sentiment Polarity of Book Descriptions', fontsize=18, fontweight='bold')
+    plt.xlabel('Sentiment Polarity (-1.0 to 1.0)', fontsize=14)
+    plt.ylabel('Number of Books', fontsize=14)
+    plt.show()
+
+
+def main():
+    books_df = load_books()
+    plot_bestseller_trends(books_df)
+    plot_sentiment(books_df)
+    print("\nAnalysis complete. All charts have been generated.")
+
+
+# The main guard keeps worker processes that import this module from rerunning the analysis
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,50 @@
-from fastapi import FastAPI, HTTPException, Query
-from pydantic import BaseModel
-import uvicorn
-import pandas as pd
+from fastapi import FastAPI, HTTPException, Query, Header, Response, Depends, Body
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+import argparse
+import asyncio
+import bisect
+import contextvars
+import functools
+import hashlib
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
 import sqlite3
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
-from typing import Optional, List
+from typing import Optional, List, Dict
+from concurrent.futures import ThreadPoolExecutor
 from fastapi.middleware.cors import CORSMiddleware 
+from fastapi.middleware.gzip import GZipMiddleware
+
+import autocomplete
+import cache
+import metrics
+import model_store
+import similarity
+from ranking import select_top_n
+
+try:
+    import orjson
+except ImportError:  # Optional: responses fall back to the standard json module
+    orjson = None
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # Optional: responses are gzip-compressed only
+    BrotliMiddleware = None
+
+# Number of most similar books kept per title in the neighbor index; it is
+# also the most recommendations one request can ask for.
+NUM_NEIGHBORS = int(os.environ.get("NUM_NEIGHBORS", 50))
+# Most titles accepted in one batch request.
+MAX_BATCH_TITLES = int(os.environ.get("MAX_BATCH_TITLES", 100))
 
 # --- 1. Data Structures for API Responses ---
 
@@ -30,37 +67,156 @@ class RecommendationResponse(BaseModel):
     recommendations: List[Book]
 
 
+class RankingWeights(BaseModel):
+    """Weights of the hybrid score: similarity, Bayesian-averaged rating and log review count, each scaled to 0-1."""
+    similarity: float = Field(1.0, ge=0)
+    rating: float = Field(0.2, ge=0)
+    reviews: float = Field(0.1, ge=0)
+
+
+class RecommendationFilters(BaseModel):
+    """Optional constraints every recommended book must meet."""
+    genre: Optional[str] = None
+    min_price: Optional[float] = Field(None, ge=0)
+    max_price: Optional[float] = Field(None, ge=0)
+    min_rating: Optional[float] = Field(None, ge=0)
+
+
+class BatchRecommendationRequest(BaseModel):
+    """Schema for a batch of title-based recommendation queries."""
+    titles: List[str] = Field(max_length=MAX_BATCH_TITLES)
+    num_recs: int = Field(10, ge=1, le=NUM_NEIGHBORS)
+    weights: RankingWeights = Field(default_factory=RankingWeights)
+    filters: RecommendationFilters = Field(default_factory=RecommendationFilters)
+
+
+class BatchRecommendationResponse(BaseModel):
+    """Schema for batch recommendations, keyed by the requested title."""
+    results: Dict[str, RecommendationResponse]
+    errors: Dict[str, str]
+
+
+class BookIn(BaseModel):
+    """Schema for a book added or updated through the ingest endpoint."""
+    title: str
+    author: str = 'Unknown'
+    genre: str = 'Unknown'
+    price: float = 0.0
+    rating: float = 0.0
+    reviews: int = 0
+    description: str = ''
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson when installed; content must already match the schema."""
+
+    def render(self, content) -> bytes:
+        with metrics.timed("render"):
+            if orjson is not None:
+                return orjson.dumps(content)
+            return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+# Fields of Book read from the catalog, and all fields in schema order
+BOOK_COLUMNS = ['title', 'author', 'genre', 'price', 'rating', 'reviews']
+BOOK_FIELDS = BOOK_COLUMNS + ['similarity_score', 'relevance_score']
+# Columns of the in-memory catalog; descriptions are read only to fit the model
+CATALOG_COLUMNS = ['book_id'] + BOOK_COLUMNS
+
+
+class Suggestion(BaseModel):
+    """Schema for one autocomplete suggestion."""
+    title: Optional[str] = None
+    author: str
+    reviews: int
+    match: str
+    score: float
+
+
+class SearchResult(BaseModel):
+    """Schema for one full-text search hit; `score` is the negated bm25 (higher is better)."""
+    book_id: int
+    title: Optional[str] = None
+    author: Optional[str] = None
+    genre: Optional[str] = None
+    price: Optional[float] = None
+    rating: Optional[float] = None
+    reviews: Optional[int] = None
+    score: Optional[float] = None
+
+
+class IngestResponse(BaseModel):
+    """Schema for the result of an ingest call."""
+    added: int
+    updated: int
+    seconds: float
+
+
 # --- 2. Global Variables for Data and Model ---
 
-books_df = pd.DataFrame()
-cosine_sim = np.array([])
-indices = pd.Series(dtype='object')
+DB_PATH = "books.db"
+# Directory holding the prebuilt, memory-mappable model artifact.
+MODEL_DIR = os.environ.get("MODEL_DIR", "model")
+# "full" reads the catalog from books.db with pandas at startup. "lean" reads
+# it from the model artifact with NumPy only and loads the TF-IDF rows on the
+# first request that scores text. pandas, SciPy and scikit-learn are imported
+# only where they are used, so a lean worker that serves from the neighbor
+# index never loads them.
+SERVING_MODE = os.environ.get("SERVING_MODE", "full")
+TFIDF_PARAMS = {"stop_words": "english", "max_df": 0.8}
+# NUM_NEIGHBORS and MAX_BATCH_TITLES are set above the request schemas that validate against them.
+# "exact" scores the whole catalog; "ivf" is approximate and scales to millions of books.
+SIMILARITY_BACKEND = os.environ.get("SIMILARITY_BACKEND", "exact")
+
+# How often workers check books.db for changes and refit in the background (0 disables).
+REFIT_INTERVAL_SECONDS = float(os.environ.get("REFIT_INTERVAL_SECONDS", 300))
+# The admin endpoints answer 404 unless this is set, and then require it in
+# the X-Admin-Token header (any page a browser opens can reach a local API).
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+# Most books accepted in one ingest call; the incremental update scores the
+# whole batch against the catalog at once.
+MAX_INGEST_BOOKS = int(os.environ.get("MAX_INGEST_BOOKS", 1000))
+# Ratings are on a 0-5 scale; /analysis/data bins them over this range
+RATING_RANGE = (0.0, 5.0)
+
+# bm25 column weights of the full-text search: title, author, description
+SEARCH_WEIGHTS = (10.0, 5.0, 1.0)
+# Hybrid re-ranking: candidates scored per request (at least num_recs), and
+# the number of reviews at which a book's own rating and the catalog mean
+# count equally in its Bayesian-averaged rating.
+RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", 100))
+RATING_PRIOR_REVIEWS = float(os.environ.get("RATING_PRIOR_REVIEWS", 100))
+# CPU-bound request work (scoring, re-ranking, serialization) runs on this many
+# threads, off the event loop; 0 runs it inline. Requests beyond
+# MAX_IN_FLIGHT queued or running computations are turned away with a 503.
+COMPUTE_THREADS = int(os.environ.get("COMPUTE_THREADS", min(8, os.cpu_count() or 1)))
+MAX_IN_FLIGHT = int(os.environ.get("MAX_IN_FLIGHT", 64))
+# Recommendation response cache: entries per worker, time to live, and an
+# optional SQLite file that lets all workers on a machine share warm entries.
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", 1024))
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", 300))
+RESPONSE_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH")
+
+# The loaded RecommendationModel. Requests read it once and use that snapshot
+# throughout; ingests and refits replace it as a whole under model_lock.
+model = None
+model_lock = threading.Lock()
+# Seconds the last full refresh took to load the catalog and the artifact (for /metrics)
+model_load_seconds = None
 
 
 # --- 3. Core Logic Functions (Retained in Backend) ---
 
-def load_data():
-    """Connects to the database and loads the Books table."""
+def load_data(columns=None):
+    """Connects to the database and loads the Books table (only `columns`, if given)."""
+    import pandas as pd
+
     try:
-        conn = sqlite3.connect("books.db")
-        df = pd.read_sql_query("SELECT * FROM Books", conn)
+        conn = sqlite3.connect(DB_PATH)
+        df = pd.read_sql_query(f"SELECT {', '.join(columns) if columns else '*'} FROM Books", conn)
         conn.close()
 
-        # Clean and standardize columns
-        df.columns = df.columns.str.lower()
-        df['description'] = df['description'].fillna('')
-        df['genre'] = df['genre'].fillna('Unknown')
-        df['author'] = df['author'].fillna('Unknown')
-        
-        # Ensure numeric types
-        df['rating'] = pd.to_numeric(df['rating'], errors='coerce').fillna(0)
-        df['reviews'] = pd.to_numeric(df['reviews'], errors='coerce').fillna(0)
-        
-        # Ensure 'price' column exists and is numeric, defaulting to 0.0 if not found
-        if 'price' not in df.columns:
-            df['price'] = 0.0
-        df['price'] = pd.to_numeric(df['price'], errors='coerce').fillna(0.0)
-
+        df = clean_books(df)
         df = df.drop_duplicates(subset=['title', 'author'])
         df = df.reset_index(drop=True)
         
@@ -70,63 +226,847 @@ def load_data():
         return pd.DataFrame()
 
 
-def setup_recommendation_model(df):
-    """Sets up the TF-IDF vectorizer and cosine similarity matrix."""
-    if df.empty:
-        return np.array([]), pd.Series(dtype='object')
+def clean_books(df):
+    """Standardizes column names, fills missing values and coerces numeric columns."""
+    import pandas as pd
+
+    df.columns = df.columns.str.lower()
+    if 'description' in df.columns:
+        df['description'] = df['description'].fillna('')
+    df['genre'] = df['genre'].fillna('Unknown')
+    df['author'] = df['author'].fillna('Unknown')
+    
+    # Ensure numeric types
+    df['rating'] = pd.to_numeric(df['rating'], errors='coerce').fillna(0)
+    df['reviews'] = pd.to_numeric(df['reviews'], errors='coerce').fillna(0)
+    
+    # Ensure 'price' column exists and is numeric, defaulting to 0.0 if not found
+    if 'price' not in df.columns:
+        df['price'] = 0.0
+    df['price'] = pd.to_numeric(df['price'], errors='coerce').fillna(0.0)
+    return df
+
+
+def compact_catalog(df):
+    """The catalog as the API keeps it in memory: CATALOG_COLUMNS only, with categorical and compact numeric dtypes."""
+    catalog = df[[column for column in CATALOG_COLUMNS if column in df.columns]].copy()
+    for column in ('genre', 'author'):
+        catalog[column] = catalog[column].astype('category')
+    for column in ('price', 'rating'):
+        catalog[column] = catalog[column].astype(np.float32)
+    catalog['reviews'] = catalog['reviews'].clip(0, np.iinfo(np.int32).max).astype(np.int32)
+    if 'book_id' in catalog.columns:
+        catalog['book_id'] = catalog['book_id'].astype(np.int32)
+    return catalog
+
+
+def catalog_columns(df):
+    """The columns of a compact catalog as NumPy arrays, the form the model keeps them in."""
+    columns = {
+        'title': df['title'].astype(object).where(df['title'].notna(), None).to_numpy(),
+        'author': df['author'].astype(object).to_numpy(),
+        'genre': df['genre'].astype(object).to_numpy(),
+        'price': df['price'].to_numpy(),
+        'rating': df['rating'].to_numpy(),
+        'reviews': df['reviews'].to_numpy(),
+    }
+    if 'book_id' in df.columns:
+        columns['book_id'] = df['book_id'].to_numpy()
+    return columns
+
+
+def catalog_bytes(columns):
+    """Bytes held by catalog columns, counting each string object once (books share author and genre strings)."""
+    total = 0
+    for values in columns.values():
+        total += values.nbytes
+        if values.dtype == object:
+            distinct = {id(value): value for value in values.tolist()}
+            total += sum(sys.getsizeof(value) for value in distinct.values())
+    return int(total)
+
+
+def factorize(values):
+    """Returns (codes, uniques) in order of first appearance, like pandas.factorize without pandas."""
+    index = {}
+    codes = np.fromiter((index.setdefault(value, len(index)) for value in values), dtype=np.int64, count=len(values))
+    return codes, list(index)
+
+
+def encode_catalog(df):
+    """The compact catalog as model artifact arrays, so lean workers need not read books.db."""
+    columns = catalog_columns(compact_catalog(df))
+    titles = columns['title']
+    arrays = {"catalog_title_missing": np.array([title is None for title in titles], dtype=bool)}
+    arrays["catalog_title_blob"], arrays["catalog_title_offsets"] = model_store.encode_strings(
+        ['' if title is None else title for title in titles]
+    )
+    for name in ('author', 'genre'):
+        codes, uniques = factorize(columns[name].tolist())
+        arrays[f"catalog_{name}_codes"] = codes.astype(np.int32)
+        arrays[f"catalog_{name}_blob"], arrays[f"catalog_{name}_offsets"] = model_store.encode_strings(uniques)
+    for name in ('price', 'rating', 'reviews', 'book_id'):
+        if name in columns:
+            arrays[f"catalog_{name}"] = columns[name]
+    return arrays
+
 
-    # Feature engineering for similarity model
-    df['combined_features'] = df.apply(
+def decode_catalog(arrays):
+    """Inverse of encode_catalog, giving the same columns as catalog_columns."""
+    titles = np.array(model_store.decode_strings(arrays["catalog_title_blob"], arrays["catalog_title_offsets"]),
+                      dtype=object)
+    titles[np.asarray(arrays["catalog_title_missing"])] = None
+    columns = {'title': titles}
+    for name in ('author', 'genre'):
+        uniques = np.array(model_store.decode_strings(arrays[f"catalog_{name}_blob"], arrays[f"catalog_{name}_offsets"]),
+                           dtype=object)
+        columns[name] = uniques[arrays[f"catalog_{name}_codes"]]
+    for name in ('price', 'rating', 'reviews', 'book_id'):
+        if f"catalog_{name}" in arrays:
+            columns[name] = arrays[f"catalog_{name}"]
+    return columns
+
+
+def as_float64(values):
+    """Widens float32 values to the float64 with the same shortest decimal form (4.7 stays 4.7)."""
+    values = np.asarray(values)
+    if values.dtype == np.float32:
+        return values.astype(str).astype(np.float64)
+    return values.astype(np.float64, copy=False)
+
+
+def normalize_title(title) -> str:
+    """Casefolds a title and collapses whitespace so lookups ignore case and spacing."""
+    return " ".join(str(title).casefold().split())
+
+
+def build_title_lookup(columns):
+    """Maps each normalized title to the rows of every book with that title, most reviewed first."""
+    lookup = {}
+    titles = np.asarray(columns['title'], dtype=object)
+    # Positions, most reviewed first; ties keep catalog order
+    for idx in np.argsort(-np.asarray(columns['reviews'], dtype=np.int64), kind='stable').tolist():
+        title = titles[idx]
+        if isinstance(title, str):
+            lookup.setdefault(normalize_title(title), []).append(idx)
+    return {title: tuple(rows) for title, rows in lookup.items()}
+
+
+def build_autocomplete_arrays(columns):
+    """Builds the autocomplete index arrays over the normalized titles and authors."""
+    title_keys = [normalize_title(title) if isinstance(title, str) else None for title in columns['title']]
+    author_keys = [normalize_title(author) for author in columns['author']]
+    return autocomplete.build_index(title_keys, author_keys, np.asarray(columns['reviews']))
+
+
+def combine_features(df):
+    """Genre, description and author as one document per book, for TF-IDF."""
+    return df.apply(
         lambda row: f"{row['genre'].replace(' ', '')} {row['description']} {row['author'].replace(' ', '')}", axis=1
     )
 
-    tfidf = TfidfVectorizer(stop_words='english', max_df=0.8)
-    tfidf_matrix = tfidf.fit_transform(df['combined_features'])
-    cosine_sim = cosine_similarity(tfidf_matrix, tfidf_matrix)
 
-    indices = pd.Series(df.index, index=df['title']).drop_duplicates()
+def setup_recommendation_model(df):
+    """Fits the TF-IDF vectorizer, the similarity backend and the top-K neighbor index."""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    if df.empty:
+        return None, None, None, np.empty((0, 0), dtype=np.int32), np.empty((0, 0), dtype=np.float32)
+
+    # Feature engineering for similarity model; the documents are dropped after fitting
+    tfidf = TfidfVectorizer(**TFIDF_PARAMS)
+    tfidf_matrix = tfidf.fit_transform(combine_features(df)).astype(np.float32)
+    backend = similarity.SIMILARITY_BACKENDS[SIMILARITY_BACKEND].build(tfidf_matrix)
+    neighbor_ids, neighbor_scores = backend.neighbor_index(NUM_NEIGHBORS)
     
-    return cosine_sim, indices
+    return tfidf, tfidf_matrix, backend, neighbor_ids, neighbor_scores
+
+
+def model_params():
+    """Settings baked into the model artifact; changing any of them forces a rebuild."""
+    params = {"tfidf": TFIDF_PARAMS, "num_neighbors": NUM_NEIGHBORS, "backend": SIMILARITY_BACKEND}
+    if SIMILARITY_BACKEND == "ivf":
+        params["ivf"] = similarity.IVF_PARAMS
+    return params
+
+
+def build_model_artifact(df, db_hash, db_stats):
+    """Fits the model on `df` and writes it to MODEL_DIR as memory-mappable arrays."""
+    start = time.perf_counter()
+    tfidf, tfidf_matrix, backend, neighbor_ids, neighbor_scores = setup_recommendation_model(df)
+    fit_seconds = time.perf_counter() - start
+
+    terms = sorted(tfidf.vocabulary_, key=tfidf.vocabulary_.get)
+    vocabulary_blob, vocabulary_offsets = model_store.encode_strings(terms)
+    arrays = {
+        **backend.state(),
+        "vocabulary_blob": vocabulary_blob,
+        "vocabulary_offsets": vocabulary_offsets,
+        "tfidf_data": tfidf_matrix.data,
+        "tfidf_indices": tfidf_matrix.indices,
+        "tfidf_indptr": tfidf_matrix.indptr,
+        "idf": tfidf.idf_.astype(np.float32),
+        "neighbor_ids": neighbor_ids,
+        "neighbor_scores": neighbor_scores,
+        **build_autocomplete_arrays(df),
+        **encode_catalog(df),
+    }
+    manifest = {
+        "db_hash": db_hash,
+        "db_stats": db_stats,
+        "params": model_params(),
+        "n_books": len(df),
+        "tfidf_shape": list(tfidf_matrix.shape),
+        "fit_seconds": round(fit_seconds, 3),
+        "build_seconds": round(time.perf_counter() - start, 3),
+    }
+    if backend.name != "exact":
+        manifest["recall_at_k"] = round(similarity.estimate_recall(backend, neighbor_ids), 4)
+        print(f"Approximate neighbor index recall@{neighbor_ids.shape[1]}: {manifest['recall_at_k']}")
+    return model_store.save_model(MODEL_DIR, arrays, manifest)
+
+
+def load_recommendation_model(df=None, rebuild=False):
+    """Memory-maps the model artifact matching books.db (rebuilding it if stale) as a RecommendationModel, or None."""
+    def is_stale(manifest, db_hash):
+        return (rebuild
+                or not model_store.is_current(manifest, db_hash, model_params())
+                or (df is not None and manifest["n_books"] != len(df)))
+
+    manifest = model_store.read_manifest(MODEL_DIR)
+    db_hash, db_stats = model_store.fingerprint_database(DB_PATH, manifest)
+    if is_stale(manifest, db_hash):
+        with model_store.build_lock(MODEL_DIR):
+            # Another worker may have finished the build while we waited
+            manifest = model_store.read_manifest(MODEL_DIR)
+            if is_stale(manifest, db_hash):
+                books = df if df is not None and 'description' in df.columns else load_data()
+                if books.empty:
+                    return None
+                print(f"Building model artifact in '{MODEL_DIR}'...")
+                build_model_artifact(books, db_hash, db_stats)
+
+    arrays, manifest = model_store.load_model(MODEL_DIR)
+    if df is None:
+        catalog, tfidf_matrix, backend = decode_catalog(arrays), None, None
+    else:
+        catalog = catalog_columns(compact_catalog(df))
+        tfidf_matrix, backend = load_similarity_backend(arrays, manifest)
+    return RecommendationModel(
+        catalog, tfidf_matrix, backend, arrays["neighbor_ids"], arrays["neighbor_scores"],
+        db_hash=manifest["db_hash"], version=manifest["version"], artifact_arrays=arrays, manifest=manifest,
+        build_seconds=manifest.get("build_seconds")
+    )
+
+
+def load_similarity_backend(arrays, manifest):
+    """Returns the artifact's TF-IDF rows as a CSR matrix (no copy) and the similarity backend over them."""
+    from scipy.sparse import csr_matrix
+
+    tfidf_matrix = csr_matrix(
+        (arrays["tfidf_data"], arrays["tfidf_indices"], arrays["tfidf_indptr"]),
+        shape=tuple(manifest["tfidf_shape"]), copy=False
+    )
+    return tfidf_matrix, similarity.SIMILARITY_BACKENDS[manifest["params"]["backend"]].load(tfidf_matrix, arrays)
+
+
+def load_vectorizer(arrays):
+    """Restores the fitted TF-IDF transform from an artifact's vocabulary and idf weights."""
+    terms = model_store.decode_strings(arrays["vocabulary_blob"], arrays["vocabulary_offsets"])
+    return similarity.QueryVectorizer(terms, arrays["idf"])
+
+
+def build_query_features(query: str) -> str:
+    """Mirrors combine_features for free text, adding adjacent word pairs with spaces removed."""
+    words = query.split()
+    joined = [a + b for a, b in zip(words, words[1:])]
+    if len(words) > 2:
+        joined.append("".join(words))
+    return " ".join(words + joined)
+
+
+class RecommendationModel:
+    """The catalog and everything fitted on it, used as one immutable snapshot."""
+
+    def __init__(self, catalog, tfidf_matrix, backend, neighbor_ids, neighbor_scores,
+                 db_hash, version, artifact_arrays=None, manifest=None, vectorizer=None, title_lookup=None,
+                 autocomplete_index=None, build_seconds=None):
+        self.columns = catalog
+        self.n_books = len(catalog['title'])
+        # L2-normalised TF-IDF rows (float32 CSR) and the backend over them;
+        # None until first use when loaded in lean mode (see `backend`)
+        self._tfidf_matrix = tfidf_matrix
+        self._backend = backend
+        self.neighbor_ids = neighbor_ids
+        self.neighbor_scores = neighbor_scores
+        # Hash of the books.db the artifact was built from, and a unique id of this snapshot
+        self.db_hash = db_hash
+        self.version = version
+        self.title_lookup = build_title_lookup(catalog) if title_lookup is None else title_lookup
+        # How long fitting the artifact took, from its manifest (for /metrics)
+        self.build_seconds = build_seconds
+        self._artifact_arrays = artifact_arrays
+        self._manifest = manifest
+        self._vectorizer = vectorizer
+        self._books_df = None
+        # Analytics aggregates, computed on first use (the snapshot never changes)
+        self._value_counts = None
+        self._rating_histograms = {}
+        self._popularity = None
+        self._genre_masks = None
+        self._filter_masks = cache.LRUCache(max_entries=64, ttl_seconds=0)
+        self._title_index = None
+        self._autocomplete = autocomplete_index
+        self._autocomplete_extra = None
+        self._memory_usage = None
+
+    @property
+    def vectorizer(self):
+        """The fitted TF-IDF transform for free-text queries, restored from the artifact on first use."""
+        if self._vectorizer is None:
+            self._vectorizer = load_vectorizer(self._artifact_arrays)
+        return self._vectorizer
+
+    @property
+    def backend(self):
+        """The similarity backend, built from the artifact on first use in lean mode."""
+        if self._backend is None:
+            self._tfidf_matrix, self._backend = load_similarity_backend(self._artifact_arrays, self._manifest)
+        return self._backend
+
+    @property
+    def tfidf_matrix(self):
+        if self._tfidf_matrix is None:
+            self.backend
+        return self._tfidf_matrix
+
+    @property
+    def books_df(self):
+        """The catalog as a DataFrame, built on first use for tooling (requests and ingests use `columns`)."""
+        if self._books_df is None:
+            import pandas as pd
+
+            self._books_df = pd.DataFrame(self.columns)
+        return self._books_df
+
+    def analytics(self, num_top: int = 10, rating_bins: int = 10) -> dict:
+        """Returns the top genres and authors and a binned rating histogram, cached per snapshot."""
+        if self._value_counts is None:
+            self._value_counts = {}
+            for column in ('genre', 'author'):
+                # Most frequent first; ties keep catalog order
+                codes, values = factorize(self.columns[column].tolist())
+                counts = np.bincount(codes, minlength=len(values))
+                self._value_counts[column] = [(values[i], int(counts[i]))
+                                              for i in np.argsort(-counts, kind='stable').tolist()]
+        histogram = self._rating_histograms.get(rating_bins)
+        if histogram is None:
+            counts, edges = np.histogram(as_float64(self.columns['rating']), bins=rating_bins, range=RATING_RANGE)
+            histogram = {"edges": edges.round(4).tolist(), "counts": counts.tolist()}
+            self._rating_histograms[rating_bins] = histogram
+
+        return {
+            "version": self.version,
+            "num_books": self.n_books,
+            "top_genres": dict(self._value_counts['genre'][:num_top]),
+            "top_authors": dict(self._value_counts['author'][:num_top]),
+            "rating_histogram": histogram,
+        }
+
+    def lookup_neighbors(self, book_indices, num_recs: int = 10):
+        """Returns the neighbor ids and scores for one book index or a batch of them."""
+        rows = np.asarray(book_indices)
+        return self.neighbor_ids[rows, :num_recs], self.neighbor_scores[rows, :num_recs]
+
+    def find_books(self, book_title: str, author: Optional[str] = None) -> tuple:
+        """Returns the row ids of the books matching a title (and author, if given), most reviewed first."""
+        rows = self.title_lookup.get(normalize_title(book_title), ())
+        if author is not None:
+            author = normalize_title(author)
+            authors = self.columns['author']
+            rows = tuple(idx for idx in rows if normalize_title(authors[idx]) == author)
+        return rows
+
+    @property
+    def title_index(self):
+        """Unique titles as sorted (normalized title, title) pairs, built once per snapshot."""
+        if self._title_index is None:
+            titles = {title for title in self.columns['title'].tolist() if title is not None}
+            self._title_index = sorted((normalize_title(title), title) for title in titles)
+        return self._title_index
+
+    def titles_page(self, prefix: str = '', cursor: Optional[str] = None, offset: int = 0, limit: int = 100):
+        """Returns (titles, next_cursor, total) for one page of the titles starting with `prefix`."""
+        index = self.title_index
+        key = normalize_title(prefix)
+        start = bisect.bisect_left(index, (key,))
+        end = bisect.bisect_left(index, (key + '\U0010ffff',)) if key else len(index)
+        total = end - start
+        if cursor is not None:
+            start = max(start, bisect.bisect_right(index, (normalize_title(cursor), cursor)))
+        start = min(start + offset, end)
+        stop = min(start + limit, end)
+        titles = [title for _, title in index[start:stop]]
+        next_cursor = titles[-1] if titles and stop < end else None
+        return titles, next_cursor, total
+
+    @property
+    def autocomplete(self):
+        """The autocomplete index, memory-mapped from the artifact (or built if there is none)."""
+        if self._autocomplete is None:
+            arrays = self._artifact_arrays
+            if arrays is None or "autocomplete_key_blob" not in arrays:
+                arrays = build_autocomplete_arrays(self.columns)
+            self._autocomplete = autocomplete.AutocompleteIndex(arrays)
+        return self._autocomplete
+
+    def memory_usage(self) -> dict:
+        """Bytes held by the catalog and each part of the fitted model, computed once per snapshot."""
+        if self._memory_usage is not None:
+            return self._memory_usage
+        usage = {
+            "catalog": catalog_bytes(self.columns),
+            "neighbor_index": self.neighbor_ids.nbytes + self.neighbor_scores.nbytes,
+        }
+        if self._backend is None:
+            # Lean mode before the first scoring request: size the arrays without loading them
+            arrays = self._artifact_arrays
+            prefix = self._manifest["params"]["backend"] + "_"
+            usage["tfidf_matrix"] = sum(arrays[name].nbytes for name in ("tfidf_data", "tfidf_indices", "tfidf_indptr"))
+            usage["similarity_backend"] = sum(array.nbytes for name, array in arrays.items() if name.startswith(prefix))
+        else:
+            tfidf = self.tfidf_matrix
+            usage["tfidf_matrix"] = tfidf.data.nbytes + tfidf.indices.nbytes + tfidf.indptr.nbytes
+            usage["similarity_backend"] = sum(np.asarray(array).nbytes for array in self.backend.state().values())
+        if self._artifact_arrays is not None:
+            usage["autocomplete"] = sum(array.nbytes for name, array in self._artifact_arrays.items()
+                                        if name.startswith("autocomplete_"))
+        self._memory_usage = usage
+        return usage
+
+    def suggest(self, query: str, limit: int = 10) -> List[dict]:
+        """Autocomplete suggestions for the query, ranked by match quality, then reviews."""
+        index = self.autocomplete
+        if self._autocomplete_extra is None:
+            # Books ingested since the index was built are scanned directly
+            titles, authors = self.columns['title'][index.n_rows:], self.columns['author'][index.n_rows:]
+            self._autocomplete_extra = [
+                (normalize_title(title) if isinstance(title, str) else None, normalize_title(author), row)
+                for row, title, author in zip(range(index.n_rows, self.n_books), titles, authors)
+            ]
+        columns = self.columns
+        return [
+            {"title": columns['title'][row], "author": columns['author'][row],
+             "reviews": int(columns['reviews'][row]), "match": match, "score": score}
+            for row, match, score in index.search(normalize_title(query), limit, columns['reviews'],
+                                                  self._autocomplete_extra)
+        ]
+
+    @property
+    def popularity(self):
+        """Bayesian-averaged rating and log review count per book, scaled to 0-1 once per snapshot."""
+        if self._popularity is None:
+            columns = self.columns
+            rating, reviews = as_float64(columns['rating']), columns['reviews'].clip(min=0).astype(np.float64)
+            reviewed = reviews > 0
+            mean = rating[reviewed].mean() if reviewed.any() else (rating.mean() if len(rating) else 0.0)
+            bayesian = (reviews * rating + RATING_PRIOR_REVIEWS * mean) / (reviews + RATING_PRIOR_REVIEWS)
+            log_reviews = np.log1p(reviews)
+            self._popularity = (
+                (bayesian / RATING_RANGE[1]).astype(np.float32),
+                (log_reviews / max(log_reviews.max(initial=0.0), 1.0)).astype(np.float32),
+            )
+        return self._popularity
+
+    @property
+    def genre_masks(self):
+        """Boolean row mask per normalized genre, built once per snapshot."""
+        if self._genre_masks is None:
+            codes, genres = factorize(self.columns['genre'].tolist())
+            masks = {}
+            for i, genre in enumerate(genres):
+                key = normalize_title(genre)
+                masks[key] = masks[key] | (codes == i) if key in masks else codes == i
+            self._genre_masks = masks
+        return self._genre_masks
+
+    def filter_mask(self, filters: Optional[RecommendationFilters]):
+        """Returns the boolean mask of the books meeting `filters`, or None when no filter is set."""
+        if filters is None:
+            return None
+        key = tuple(filters.model_dump().values())
+        if all(value is None for value in key):
+            return None
+        mask = self._filter_masks.get(key)
+        if mask is None:
+            columns = self.columns
+            mask = np.ones(self.n_books, dtype=bool)
+            if filters.genre is not None:
+                mask &= self.genre_masks.get(normalize_title(filters.genre), False)
+            if filters.min_price is not None:
+                mask &= columns['price'] >= filters.min_price
+            if filters.max_price is not None:
+                mask &= columns['price'] <= filters.max_price
+            if filters.min_rating is not None:
+                mask &= columns['rating'] >= filters.min_rating
+            self._filter_masks.set(key, mask)
+        return mask
 
+    def rerank(self, candidate_ids, candidate_scores, n: int, weights: RankingWeights, mask=None):
+        """Re-ranks candidate lists by the hybrid score and keeps the best n as (ids, similarities, scores)."""
+        ids, similarity = np.asarray(candidate_ids), np.asarray(candidate_scores)
+        single = ids.ndim == 1
+        ids, similarity = np.atleast_2d(ids), np.atleast_2d(similarity)
 
-def get_recommendations_logic(title: str, num_recs: int = 10) -> List[Book]:
-    """Core logic for title-based (Content-Based) recommendations."""
-    if title not in indices.index:
+        rating, reviews = self.popularity
+        # Books sharing no terms with the query are not candidates, however popular
+        valid = (ids >= 0) & (similarity > 0)
+        safe_ids = np.where(valid, ids, 0)
+        if mask is not None:
+            valid &= mask[safe_ids]
+        similarity = np.where(valid, similarity, 0.0)
+        hybrid = (weights.similarity * similarity + weights.rating * rating[safe_ids]
+                  + weights.reviews * reviews[safe_ids])
+        hybrid = np.where(valid, hybrid, -np.inf).astype(np.float32)
+
+        top, top_scores = select_top_n(hybrid, n)
+        ids = np.where(np.isfinite(top_scores), np.take_along_axis(ids, top, axis=1), -1)
+        similarity = np.take_along_axis(similarity, top, axis=1)
+        if single:
+            return ids[0], similarity[0], top_scores[0]
+        return ids, similarity, top_scores
+
+    def build_book_list(self, book_indices, similarity_scores=None, relevance_scores=None) -> List[dict]:
+        """Builds the Book dicts for the given catalog rows, in schema order."""
+        # Approximate backends pad short neighbor lists with id -1
+        book_indices = np.asarray(book_indices)
+        found = book_indices >= 0
+        book_indices = book_indices[found]
+
+        values = [self.columns[name][book_indices] for name in BOOK_COLUMNS]
+        values = [(as_float64(column) if column.dtype.kind == 'f' else column).tolist() for column in values]
+        for scores in (similarity_scores, relevance_scores):
+            if scores is None:
+                values.append([None] * len(book_indices))
+            else:
+                values.append(np.asarray(scores)[found].astype(np.float64).tolist())
+        return [dict(zip(BOOK_FIELDS, row)) for row in zip(*values)]
+
+    def with_books(self, records):
+        """Returns a new model with `records` added or updated; neighbor lists are approximate until the next full refit."""
+        import pandas as pd
+
+        n_old = self.n_books
+        titles, authors = self.columns['title'], self.columns['author']
+        matches = []
+        for title, author in zip(records['title'], records['author']):
+            rows = [idx for idx in self.title_lookup.get(normalize_title(title), ())
+                    if titles[idx] == title and authors[idx] == author]
+            matches.append(rows[0] if rows else -1)
+        matches = np.array(matches, dtype=np.int64)
+        is_update = matches >= 0
+        updated_rows = matches[is_update]
+        n_updated = len(updated_rows)
+
+        # Updated books first, then the new ones, which are appended in this order
+        changed_records = pd.concat([records[is_update], records[~is_update]], ignore_index=True)
+        n_books = n_old + len(changed_records) - n_updated
+        changed = np.concatenate([updated_rows, np.arange(n_old, n_books)])
+
+        # Updated books keep their book_id; every other column takes the new values
+        compact = catalog_columns(compact_catalog(changed_records))
+        catalog = {}
+        for name, values in self.columns.items():
+            column = np.concatenate([values, compact[name][n_updated:]])
+            if name != 'book_id':
+                column[updated_rows] = compact[name][:n_updated]
+            catalog[name] = column
+
+        # The catalog holds no descriptions, so the documents come from `records`
+        vectors = self.vectorizer.transform(combine_features(changed_records)).astype(np.float32)
+        tfidf_matrix = similarity.splice_rows(self.tfidf_matrix, updated_rows, vectors)
+        backend = self.backend.with_rows(tfidf_matrix, changed)
+
+        k = self.neighbor_ids.shape[1]
+        neighbor_ids = np.full((n_books, k), -1, dtype=np.int32)
+        neighbor_scores = np.full((n_books, k), -np.inf, dtype=np.float32)
+        neighbor_ids[:n_old] = self.neighbor_ids
+        neighbor_scores[:n_old] = self.neighbor_scores
+
+        # Books sharing terms with a changed book need it merged in only if it
+        # beats their last neighbor; books listing an updated book drop that
+        # stale entry and re-merge it with its new score (only books that
+        # shared terms with it can list it). Their true next-best neighbor
+        # was never stored, so their last slots can differ from a full refit.
+        new_scores = (tfidf_matrix @ vectors.T).tocsr()
+        sharing = np.diff(new_scores.indptr) > 0
+        sharing[changed] = False
+        sharing = np.flatnonzero(sharing)
+        affected = np.empty(0, dtype=np.int64)
+        if k and len(sharing):
+            best = new_scores[sharing].max(axis=1).toarray().ravel()
+            affected = sharing[best >= neighbor_scores[sharing, -1]]
+        if k and n_updated:
+            old_scores = (self.tfidf_matrix @ self.tfidf_matrix[updated_rows].T).tocsr()
+            listed = np.diff(old_scores.indptr) > 0
+            listed[updated_rows] = False
+            listed = np.flatnonzero(listed)
+            listed = listed[np.isin(neighbor_ids[listed], updated_rows).any(axis=1)]
+            affected = np.union1d(affected, listed)
+
+        block_size = max(1, similarity.SIMILARITY_BLOCK_ELEMENTS // (k + len(changed)))
+        for start in range(0, len(affected), block_size):
+            rows = affected[start:start + block_size]
+            current_scores = neighbor_scores[rows]
+            current_scores[np.isin(neighbor_ids[rows], changed)] = -np.inf  # Stale entries
+            candidate_ids = np.hstack([neighbor_ids[rows], np.broadcast_to(changed, (len(rows), len(changed)))])
+            candidate_scores = np.hstack([current_scores, new_scores[rows].toarray()])
+            top, top_scores = select_top_n(candidate_scores, k)
+            neighbor_ids[rows] = np.where(np.isfinite(top_scores), np.take_along_axis(candidate_ids, top, axis=1), -1)
+            neighbor_scores[rows] = top_scores
+
+        fresh_ids, fresh_scores = backend.query(tfidf_matrix[changed], k, exclude=changed)
+        neighbor_ids[changed, :fresh_ids.shape[1]] = fresh_ids
+        neighbor_scores[changed, :fresh_ids.shape[1]] = fresh_scores
+
+        # Only the titles of changed books need their lookup entries refreshed
+        title_lookup = dict(self.title_lookup)
+        reviews = catalog['reviews']
+        for idx in changed:
+            title = catalog['title'][idx]
+            if isinstance(title, str):
+                key = normalize_title(title)
+                rows = set(title_lookup.get(key, ())) | {int(idx)}
+                title_lookup[key] = tuple(sorted(rows, key=lambda row: (-reviews[row], row)))
+
+        # "<artifact version>+<ingests>.<digest>": the digest chains the records
+        # of every ingest applied since the artifact, so workers sharing
+        # RESPONSE_CACHE_PATH (or an ETag) agree on a version only if they
+        # applied the same changes to the same artifact.
+        base, _, applied = self.version.partition("+")
+        updates = int(applied.split(".")[0]) + 1 if applied else 1
+        digest = hashlib.blake2b(self.version.encode('utf-8'), digest_size=8)
+        digest.update(records.to_csv(index=False).encode('utf-8'))
+        return RecommendationModel(
+            catalog, tfidf_matrix, backend, neighbor_ids, neighbor_scores,
+            db_hash=self.db_hash, version=f"{base}+{updates}.{digest.hexdigest()}",
+            vectorizer=self.vectorizer, title_lookup=title_lookup, autocomplete_index=self.autocomplete,
+            build_seconds=self.build_seconds
+        )
+
+
+def get_recommendations_logic(model: RecommendationModel, idx: int, num_recs: int = 10,
+                              weights: Optional[RankingWeights] = None,
+                              filters: Optional[RecommendationFilters] = None) -> List[dict]:
+    """Core logic for title-based recommendations: the stored neighbors of row `idx`, filtered and re-ranked."""
+    with metrics.timed("similarity"):
+        mask = model.filter_mask(filters)
+        n_candidates = max(num_recs, RERANK_CANDIDATES)
+        # Neighbors are stored best first and never include the book itself
+        book_indices, sim_scores = model.lookup_neighbors(idx, n_candidates)
+        if mask is not None:
+            found = (book_indices >= 0) & (sim_scores > 0)
+            if np.count_nonzero(mask[book_indices[found]]) < num_recs:
+                book_indices, sim_scores = model.backend.query(
+                    model.tfidf_matrix[[idx]], n_candidates, exclude=np.array([idx]), mask=mask
+                )
+                book_indices, sim_scores = book_indices[0], sim_scores[0]
+    with metrics.timed("top_n"):
+        book_indices, sim_scores, scores = model.rerank(
+            book_indices, sim_scores, num_recs, weights or RankingWeights(), mask
+        )
+    with metrics.timed("serialize"):
+        return model.build_book_list(book_indices, sim_scores, scores)
+
+
+def get_query_recommendations_logic(model: RecommendationModel, query: str, num_recs: int = 10,
+                                    weights: Optional[RankingWeights] = None,
+                                    filters: Optional[RecommendationFilters] = None) -> List[dict]:
+    """Free-text recommendations from the fitted vectorizer, filtered and re-ranked."""
+    with metrics.timed("vectorize"):
+        query_vector = model.vectorizer.transform([build_query_features(query)]).astype(np.float32)
+    if query_vector.nnz == 0:
         return []
 
-    idx = indices[title]
-    sim_scores = list(enumerate(cosine_sim[idx]))
-    sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-    sim_scores = sim_scores[1:num_recs + 1] # Exclude itself, take top N
+    with metrics.timed("similarity"):
+        mask = model.filter_mask(filters)
+        book_indices, scores = model.backend.query(query_vector, max(num_recs, RERANK_CANDIDATES), mask=mask)
+    with metrics.timed("top_n"):
+        book_indices = np.where(scores[0] > 0, book_indices[0], -1)
+        book_indices, sim_scores, scores = model.rerank(book_indices, scores[0], num_recs, weights or RankingWeights())
+    with metrics.timed("serialize"):
+        return model.build_book_list(book_indices, sim_scores, scores)
+
+
+def get_batch_recommendations_logic(model: RecommendationModel, titles: List[str], num_recs: int = 10,
+                                    weights: Optional[RankingWeights] = None,
+                                    filters: Optional[RecommendationFilters] = None):
+    """Recommendations for many titles in one pass; returns (results, errors) keyed by requested title."""
+    found, errors = {}, {}
+    with metrics.timed("lookup"):
+        for requested in titles:
+            rows = model.find_books(requested)
+            if not rows:
+                errors[requested] = f"Book '{requested}' not found in the database."
+            else:
+                found[requested] = (model.columns['title'][rows[0]], rows[0])
+
+    results = {}
+    if found:
+        rows = np.array([idx for _, idx in found.values()])
+        with metrics.timed("similarity"):
+            book_indices, sim_scores = model.backend.query(
+                model.tfidf_matrix[rows], max(num_recs, RERANK_CANDIDATES), exclude=rows, mask=model.filter_mask(filters)
+            )
+        with metrics.timed("top_n"):
+            book_indices, sim_scores, scores = model.rerank(book_indices, sim_scores, num_recs, weights or RankingWeights())
+        with metrics.timed("serialize"):
+            for i, (requested, (search_title, _)) in enumerate(found.items()):
+                results[requested] = (search_title, model.build_book_list(book_indices[i], sim_scores[i], scores[i]))
+
+    return results, errors
+
+
+def upsert_books(records):
+    """Writes books to books.db, updating rows with the same title and author; returns their book_ids."""
+    conn = sqlite3.connect(DB_PATH)
+    book_ids = []
+    try:
+        with conn:
+            for book in records.itertuples(index=False):
+                values = (book.genre, book.price, book.rating, int(book.reviews), book.description)
+                cursor = conn.execute(
+                    "UPDATE Books SET genre = ?, price = ?, rating = ?, reviews = ?, description = ? "
+                    "WHERE title = ? AND author = ?", values + (book.title, book.author)
+                )
+                if cursor.rowcount == 0:
+                    cursor = conn.execute(
+                        "INSERT INTO Books (genre, price, rating, reviews, description, title, author) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)", values + (book.title, book.author)
+                    )
+                    book_ids.append(cursor.lastrowid)
+                else:
+                    book_ids.append(conn.execute(
+                        "SELECT MIN(book_id) FROM Books WHERE title = ? AND author = ?", (book.title, book.author)
+                    ).fetchone()[0])
+    finally:
+        conn.close()
+    return book_ids
+
+
+def fts_query(text: str) -> Optional[str]:
+    """Turns free text into a quoted FTS5 query with the last word as a prefix, or None without words."""
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words) + "*"
+
+
+def search_books(q: Optional[str], filters: RecommendationFilters, author: Optional[str] = None,
+                 limit: int = 20, offset: int = 0) -> List[dict]:
+    """Keyword search (FTS5, ranked by bm25) or filtered listing straight from books.db."""
+    conditions, params = [], []
+    if filters.genre is not None:
+        conditions.append("b.genre = ? COLLATE NOCASE")
+        params.append(filters.genre)
+    if author is not None:
+        conditions.append("b.author = ?")
+        params.append(author)
+    for column, op, value in (("price", ">=", filters.min_price), ("price", "<=", filters.max_price),
+                              ("rating", ">=", filters.min_rating)):
+        if value is not None:
+            conditions.append(f"b.{column} {op} ?")
+            params.append(value)
+
+    columns = "b.book_id, b.title, b.author, b.genre, b.price, b.rating, b.reviews"
+    if q is not None:
+        match = fts_query(q)
+        if match is None:
+            return []
+        weights = ", ".join(str(weight) for weight in SEARCH_WEIGHTS)
+        sql = (f"SELECT {columns}, -bm25(BooksFTS, {weights}) AS score "
+               f"FROM BooksFTS JOIN Books b ON b.book_id = BooksFTS.rowid "
+               f"WHERE BooksFTS MATCH ? {''.join(' AND ' + c for c in conditions)} "
+               f"ORDER BY score DESC LIMIT ? OFFSET ?")
+        params.insert(0, match)
+    else:
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        sql = f"SELECT {columns}, NULL AS score FROM Books b {where}ORDER BY b.rating DESC, b.reviews DESC LIMIT ? OFFSET ?"
+
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        cursor = conn.execute(sql, params + [limit, offset])
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor]
+    except sqlite3.OperationalError as e:
+        if "no such table" in str(e):
+            raise HTTPException(status_code=503, detail="Search index missing. Run data_processing.py.")
+        raise
+    finally:
+        conn.close()
+
+
+def ingest_books(books: List[dict]):
+    """Adds or updates books in books.db and in the loaded model; returns (added, updated) counts."""
+    global model
+    import pandas as pd
+
+    records = clean_books(pd.DataFrame(books, columns=list(BookIn.model_fields)))
+    records = records.drop_duplicates(subset=['title', 'author'], keep='last').reset_index(drop=True)
+
+    with model_lock:
+        records['book_id'] = upsert_books(records)
+        base = model
+        if base is None:
+            # Nothing loaded yet: the next refresh picks the books up from books.db
+            return len(records), 0
+        model = base.with_books(records)
+        added = model.n_books - base.n_books
+    return added, len(records) - added
 
-    book_indices = [i[0] for i in sim_scores]
-    recommendations_df = books_df.iloc[book_indices].copy()
-    
-    # Add the similarity score back to the DataFrame
-    recommendations_df['similarity_score'] = [score[1] for score in sim_scores]
-    
-    # Prepare list of Book models for response
-    results = []
-    for _, row in recommendations_df.iterrows():
-        # Using .get() ensures we don't fail if an unexpected column is missing, 
-        # though the DataFrame structure should be consistent.
-        results.append(Book(
-            title=row['title'],
-            author=row['author'],
-            genre=row['genre'],
-            price=float(row.get('price', 0.0)),
-            rating=float(row.get('rating', 0.0)),
-            reviews=int(row.get('reviews', 0)),
-            similarity_score=float(row.get('similarity_score', 0.0))
-        ))
-        
-    return results
+
+def refresh_model(rebuild=False):
+    """Swaps in a refitted model when books.db changed; returns True if a new model was installed."""
+    global model, model_load_seconds
+    base = model
+    if base is not None and not rebuild:
+        db_hash, _ = model_store.fingerprint_database(DB_PATH, model_store.read_manifest(MODEL_DIR))
+        if db_hash == base.db_hash:
+            return False
+
+    start = time.perf_counter()
+    if SERVING_MODE == "lean":
+        new_model = load_recommendation_model(rebuild=rebuild)
+    else:
+        df = load_data(CATALOG_COLUMNS)
+        new_model = None if df.empty else load_recommendation_model(df, rebuild)
+    if new_model is not None:
+        new_model.title_index  # Sort the titles now rather than on the first /titles request
+        new_model.memory_usage()  # Measured once here, so /metrics stays cheap
+    with model_lock:
+        if model is not base:
+            # An ingest swapped in a newer model meanwhile; refit again next cycle
+            return False
+        model = new_model
+        model_load_seconds = time.perf_counter() - start
+    return True
+
+
+def refit_periodically(stop_event):
+    """Background thread body: refresh the model every REFIT_INTERVAL_SECONDS."""
+    while not stop_event.wait(REFIT_INTERVAL_SECONDS):
+        try:
+            if refresh_model():
+                print("Catalog changed: recommendation model refitted and swapped in.")
+        except Exception as exc:
+            print(f"Background refit failed: {exc}")
 
 # --- 4. FastAPI Setup and Startup Events ---
 
 app = FastAPI(
     title="Book Recommendation API",
-    description="Backend API for Bestseller Analysis and Content-Based Recommendations."
+    description="Backend API for Bestseller Analysis and Content-Based Recommendations.",
+    default_response_class=FastJSONResponse
 )
 
 # CORS Configuration: Essential for allowing Streamlit (on a different port) to access this API
@@ -136,80 +1076,364 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "X-Cache", "ETag", "Server-Timing"],
 )
+# Compress large responses (titles pages, batches); brotli when brotli-asgi is installed
+if BrotliMiddleware is not None:
+    app.add_middleware(BrotliMiddleware, minimum_size=1000)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=1000)
+# Request latency per route for /metrics, and the Server-Timing header when SERVER_TIMING=1
+app.add_middleware(metrics.MetricsMiddleware)
+
+refit_stop = threading.Event()
+response_cache = cache.ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_PATH)
+
+
+def ranking_weights(
+    similarity_weight: float = Query(1.0, ge=0, description="Weight of the cosine similarity"),
+    rating_weight: float = Query(0.2, ge=0, description="Weight of the Bayesian-averaged rating"),
+    reviews_weight: float = Query(0.1, ge=0, description="Weight of log(1 + reviews)")
+) -> RankingWeights:
+    """Reads the hybrid ranking weights from the query string."""
+    return RankingWeights(similarity=similarity_weight, rating=rating_weight, reviews=reviews_weight)
+
+
+def recommendation_filters(
+    genre: Optional[str] = Query(None, description="Only books of this genre"),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    min_rating: Optional[float] = Query(None, ge=0)
+) -> RecommendationFilters:
+    """Reads the recommendation filters from the query string."""
+    return RecommendationFilters(genre=genre, min_price=min_price, max_price=max_price, min_rating=min_rating)
+
+
+def recommendation_body(recommendations: List[dict], book_title=None, query_details=None) -> dict:
+    """A RecommendationResponse as a plain dict, in schema order."""
+    return {"book_title": book_title, "query_details": query_details, "recommendations": recommendations}
+
+
+compute_pool = ThreadPoolExecutor(COMPUTE_THREADS, thread_name_prefix="compute") if COMPUTE_THREADS > 0 else None
+in_flight = 0
+
+
+async def run_compute(function, *args):
+    """Runs CPU-bound work on the compute pool, answering 503 beyond MAX_IN_FLIGHT pending calls."""
+    global in_flight
+    if compute_pool is None:
+        return function(*args)
+    if in_flight >= MAX_IN_FLIGHT:
+        raise HTTPException(status_code=503, detail="Server busy, retry shortly.", headers={"Retry-After": "1"})
+    # Only the event loop thread touches the counter, so no lock is needed
+    in_flight += 1
+    try:
+        # Run in a copy of the request's context, so stage timings reach its Server-Timing header
+        call = functools.partial(contextvars.copy_context().run, function, *args)
+        return await asyncio.get_running_loop().run_in_executor(compute_pool, call)
+    finally:
+        in_flight -= 1
+
+
+def recommendation_response(body: dict, key: tuple, hit: bool) -> FastJSONResponse:
+    """Renders a recommendation body with the HTTP caching headers, so clients and CDNs can cache it too."""
+    return FastJSONResponse(body, headers={
+        "X-Cache": "HIT" if hit else "MISS",
+        "Cache-Control": f"public, max-age={int(RESPONSE_CACHE_TTL)}",
+        "ETag": f'"{cache.key_digest(key)}"',
+    })
+
+
+async def cached_response(key: tuple, build) -> FastJSONResponse:
+    """Serves a recommendation body from the response cache, building it on the compute pool on a miss."""
+    body = response_cache.get(key)
+    if body is not None:
+        return recommendation_response(body, key, hit=True)
+
+    def compute():
+        body = build()
+        response_cache.set(key, body)
+        return recommendation_response(body, key, hit=False)
+
+    return await run_compute(compute)
+
 
 @app.on_event("startup")
 async def startup_event():
     """Initializes the data and the ML model when the server starts."""
-    global books_df, cosine_sim, indices
-    
-    books_df = load_data()
-    if books_df.empty:
+    refresh_model()
+    if REFIT_INTERVAL_SECONDS > 0:
+        threading.Thread(target=refit_periodically, args=(refit_stop,), daemon=True).start()
+
+    if model is None:
         print("API failed to initialize due to missing or empty data.")
         return
-        
-    cosine_sim, indices = setup_recommendation_model(books_df)
     print("FastAPI Book Recommendation Model Initialized successfully.")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stops the background refit thread."""
+    refit_stop.set()
+    if compute_pool is not None:
+        compute_pool.shutdown(wait=False)
+
+
 # --- 5. API Endpoints (Serve Frontend) ---
 
-@app.get("/titles", response_model=List[str], summary="Returns all unique book titles")
-async def get_all_titles():
-    """Returns a sorted list of all unique book titles for the frontend selectbox."""
-    if books_df.empty:
+@app.get("/titles", response_model=List[str], summary="Returns a page of the sorted, unique book titles")
+async def get_all_titles(
+    prefix: str = Query('', description="Only titles starting with this text (case-insensitive)"),
+    cursor: Optional[str] = Query(None, description="The X-Next-Cursor header of the previous page"),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=10000)
+):
+    """Returns one page of the unique book titles in case-insensitive order, for the frontend selectbox."""
+    current = model
+    if current is None:
         raise HTTPException(status_code=500, detail="Data not loaded.")
-    return sorted(books_df['title'].unique().tolist())
+
+    # Cursors travel percent-encoded, since headers must be ASCII
+    cursor = None if cursor is None else urllib.parse.unquote(cursor)
+    titles, next_cursor, total = current.titles_page(prefix, cursor, offset, limit)
+    headers = {"X-Total-Count": str(total)}
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = urllib.parse.quote(next_cursor, safe='')
+    return FastJSONResponse(titles, headers=headers)
+
+
+@app.get("/autocomplete", response_model=List[Suggestion], summary="Title and author suggestions as the user types")
+async def get_autocomplete(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=autocomplete.TOP_PER_PREFIX)
+):
+    """Suggests books whose title or author starts with or approximately matches `q`."""
+    current = model
+    if current is None:
+        raise HTTPException(status_code=500, detail="Data not loaded.")
+    return FastJSONResponse(current.suggest(q, limit))
+
+
+@app.get("/search", response_model=List[SearchResult], summary="Full-text search and filtered listing of the catalog")
+async def search(
+    q: Optional[str] = Query(None, min_length=1, description="Words to find in title, author or description"),
+    author: Optional[str] = Query(None, description="Only books by this author (exact name)"),
+    filters: RecommendationFilters = Depends(recommendation_filters),
+    limit: int = Query(20, ge=1, le=1000),
+    offset: int = Query(0, ge=0)
+):
+    """Full-text search of books.db ranked by bm25, or a filtered listing without `q`."""
+    return FastJSONResponse(await run_compute(search_books, q, filters, author, limit, offset))
 
 
 @app.get("/recommendations/title/{book_title}", response_model=RecommendationResponse, summary="Get recommendations based on a specific Book Title (Content-Based)")
-async def get_book_recommendations_by_title(book_title: str):
-    """
-    Finds books similar to the given title using TF-IDF and Cosine Similarity.
-    """
-    if books_df.empty or cosine_sim.size == 0:
+async def get_book_recommendations_by_title(
+    book_title: str,
+    author: Optional[str] = None,
+    num_recs: int = Query(10, ge=1, le=NUM_NEIGHBORS),
+    weights: RankingWeights = Depends(ranking_weights),
+    filters: RecommendationFilters = Depends(recommendation_filters)
+):
+    """Finds books similar to the given title from the precomputed neighbor index, re-ranked and filtered."""
+    current = model
+    if current is None:
         raise HTTPException(status_code=500, detail="Recommendation model not loaded.")
-    
-    # Find the title with correct casing from the DataFrame
-    # This step is crucial for matching the API request to the model's index
-    match = books_df[books_df['title'].str.lower().str.strip() == book_title.lower().strip()]
-    
-    if match.empty:
-        raise HTTPException(status_code=404, detail=f"Book '{book_title}' not found in the database.")
-    
-    search_title = match['title'].iloc[0]
 
-    recommendations = get_recommendations_logic(search_title, num_recs=10)
+    def build():
+        # Resolve the title through the normalized lookup built at startup
+        # This step is crucial for matching the API request to the model's index
+        with metrics.timed("lookup"):
+            rows = current.find_books(book_title, author)
 
-    if not recommendations:
-        # Note: This is rare but possible if a book has a 1.0 similarity to itself and nothing else.
-        raise HTTPException(status_code=404, detail=f"No similar books found for '{book_title}'.")
+        if not rows:
+            suggestions = [book['title'] for book in current.suggest(book_title, 3) if book['title']]
+            hint = f" Did you mean: {'; '.join(suggestions)}?" if suggestions else ""
+            raise HTTPException(status_code=404, detail=f"Book '{book_title}' not found in the database.{hint}")
 
-    return RecommendationResponse(
-        book_title=search_title,
-        recommendations=recommendations
-    )
+        idx = rows[0]
+        search_title = current.columns['title'][idx]
+        query_details = None
+        if author is None and len(rows) > 1:
+            query_details = (
+                f"{len(rows)} books share this title; showing recommendations for the one by "
+                f"{current.columns['author'][idx]}. Pass 'author' to choose another."
+            )
+
+        recommendations = get_recommendations_logic(current, idx, num_recs=num_recs, weights=weights, filters=filters)
+
+        if not recommendations:
+            # Note: This is rare but possible if a book has a 1.0 similarity to itself and nothing else.
+            raise HTTPException(status_code=404, detail=f"No similar books found for '{book_title}'.")
+
+        return recommendation_body(recommendations, book_title=search_title, query_details=query_details)
+
+    key = (current.version, "title", normalize_title(book_title),
+           None if author is None else normalize_title(author), num_recs,
+           *weights.model_dump().values(), *filters.model_dump().values())
+    return await cached_response(key, build)
+
+
+@app.get("/recommendations/query", response_model=RecommendationResponse, summary="Get recommendations for a free-text query (Content-Based)")
+async def get_query_recommendations(
+    q: str = Query(..., min_length=1, description="Free text, e.g. 'space opera adventure'"),
+    num_recs: int = Query(10, ge=1, le=NUM_NEIGHBORS),
+    weights: RankingWeights = Depends(ranking_weights),
+    filters: RecommendationFilters = Depends(recommendation_filters)
+):
+    """Finds the books most relevant to a free-text query, re-ranked and filtered."""
+    current = model
+    if current is None:
+        raise HTTPException(status_code=500, detail="Recommendation model not loaded.")
+
+    def build():
+        recommendations = get_query_recommendations_logic(current, q, num_recs, weights, filters)
+
+        if not recommendations:
+            raise HTTPException(status_code=404, detail=f"No books match the query '{q}'.")
+
+        return recommendation_body(recommendations, query_details=q)
+
+    key = (current.version, "query", q, num_recs, *weights.model_dump().values(), *filters.model_dump().values())
+    return await cached_response(key, build)
+
+
+@app.post("/recommendations/batch", response_model=BatchRecommendationResponse, summary="Get recommendations for many Book Titles in one request")
+async def get_batch_recommendations(request: BatchRecommendationRequest):
+    """Finds books similar to each of the given titles; unknown titles are reported under `errors`."""
+    current = model
+    if current is None:
+        raise HTTPException(status_code=500, detail="Recommendation model not loaded.")
+
+    def compute():
+        results, errors = get_batch_recommendations_logic(
+            current, request.titles, request.num_recs, request.weights, request.filters
+        )
+        return FastJSONResponse({
+            "results": {
+                requested: recommendation_body(recommendations, book_title=search_title)
+                for requested, (search_title, recommendations) in results.items()
+            },
+            "errors": errors,
+        })
+
+    return await run_compute(compute)
 
 
 @app.get("/analysis/data", summary="Returns data for Bestseller Analysis (Top Genres and Authors)")
-async def get_analysis_data(num_top: int = 10):
-    """
-    Provides the raw data necessary for the frontend to render analysis charts (e.g., counts and distributions).
-    """
-    if books_df.empty:
+async def get_analysis_data(
+    response: Response,
+    num_top: int = Query(10, ge=1, le=100),
+    rating_bins: int = Query(10, ge=1, le=100, description="Number of equal-width rating bins over 0-5"),
+    if_none_match: Optional[str] = Header(None)
+):
+    """Returns the aggregates for the analysis charts, with the model version as ETag."""
+    current = model
+    if current is None:
         raise HTTPException(status_code=500, detail="Data not loaded.")
-    
-    return {
-        # Convert to dictionary for JSON serialization
-        "top_genres": books_df['genre'].value_counts().head(num_top).to_dict(),
-        "top_authors": books_df['author'].value_counts().head(num_top).to_dict(),
-        # Send raw list of ratings for the frontend histogram
-        "rating_distribution": books_df['rating'].tolist() 
-    }
+
+    etag = f'"{current.version}:{num_top}:{rating_bins}"'
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    # Cheap once cached, but the first call per model version scans the catalog
+    return await run_compute(current.analytics, num_top, rating_bins)
+
+
+@app.get("/cache/stats", summary="Hit and miss counters of the recommendation response cache")
+async def get_cache_stats():
+    """Returns this worker's response cache size and hit/miss counters."""
+    return response_cache.stats()
+
+
+@app.get("/metrics", summary="Latency histograms, cache counters and model size in the Prometheus text format")
+async def get_metrics():
+    """Latency histograms, cache counters and model statistics of this worker, in the Prometheus text format."""
+    current = model
+    stats = response_cache.stats()
+    families = [
+        metrics.render_metric("book_api_cache_lookups_total", "counter", "Response cache lookups by result.", [
+            ({"result": "hit"}, stats["hits"]),
+            ({"result": "shared_hit"}, stats["shared_hits"]),
+            ({"result": "miss"}, stats["misses"]),
+        ]),
+        metrics.render_metric("book_api_cache_entries", "gauge", "Entries in the in-process response cache.",
+                              [(None, stats["entries"])]),
+        metrics.render_metric("book_api_compute_in_flight", "gauge", "Computations queued or running on the pool.",
+                              [(None, in_flight)]),
+    ]
+    if current is not None:
+        families += [
+            metrics.render_metric("book_api_model_books", "gauge", "Books in the loaded model.",
+                                  [({"version": current.version}, current.n_books)]),
+            metrics.render_metric("book_api_model_build_seconds", "gauge", "Time taken to fit the model artifact.",
+                                  [(None, current.build_seconds)]),
+            metrics.render_metric("book_api_model_load_seconds", "gauge",
+                                  "Time taken by the last full model refresh in this worker.", [(None, model_load_seconds)]),
+            metrics.render_metric("book_api_model_bytes", "gauge", "Memory held by each part of the model.",
+                                  [({"part": part}, size) for part, size in current.memory_usage().items()]),
+        ]
+    return Response(metrics.render(*families), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/admin/books", response_model=IngestResponse, summary="Add or update books without a full model rebuild")
+async def ingest_books_endpoint(books: List[BookIn] = Body(..., max_length=MAX_INGEST_BOOKS),
+                                x_admin_token: Optional[str] = Header(None)):
+    """Adds or updates books and applies them to this worker's model; disabled unless ADMIN_TOKEN is set."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest((x_admin_token or "").encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token.")
+
+    start = time.perf_counter()
+    added, updated = await run_compute(ingest_books, [book.model_dump() for book in books])
+    return IngestResponse(added=added, updated=updated, seconds=round(time.perf_counter() - start, 4))
 
 
 # --- 6. Execution Block ---
 
 if __name__ == "__main__":
-    # The API will run on port 8000 by default
-    uvicorn.run("api:app", host="0.0.0.0", port=8000, reload=True)
+    parser = argparse.ArgumentParser(description="Book Recommendation API")
+    parser.add_argument("--build-model", action="store_true",
+                        help=f"Build the model artifact in '{MODEL_DIR}' and exit (only if books.db changed)")
+    parser.add_argument("--force", action="store_true", help="Rebuild the model artifact even if it is current")
+    parser.add_argument("--ingest", metavar="CSV",
+                        help="Add or update the books in a CSV (title, author, genre, price, rating, reviews, description)")
+    parser.add_argument("--api-url", help="With --ingest: send the books to a running API instead of writing books.db")
+    args = parser.parse_args()
+
+    if args.ingest:
+        import pandas as pd
+
+        books_in = pd.read_csv(args.ingest)
+        books_in.columns = books_in.columns.str.strip().str.lower()
+        books = [BookIn(**{k: v for k, v in row.items() if pd.notna(v)}).model_dump()
+                 for row in books_in.to_dict(orient='records')]
+        if args.api_url:
+            if not ADMIN_TOKEN:
+                raise SystemExit("Set ADMIN_TOKEN to the API's admin token to ingest through it.")
+            # The API takes at most MAX_INGEST_BOOKS books per call
+            for start in range(0, len(books), MAX_INGEST_BOOKS):
+                request = urllib.request.Request(
+                    args.api_url.rstrip("/") + "/admin/books",
+                    data=json.dumps(books[start:start + MAX_INGEST_BOOKS]).encode(),
+                    headers={"Content-Type": "application/json", "X-Admin-Token": ADMIN_TOKEN}
+                )
+                with urllib.request.urlopen(request) as response:
+                    print(response.read().decode())
+        else:
+            records = clean_books(pd.DataFrame(books))
+            records = records.drop_duplicates(subset=['title', 'author'], keep='last')
+            upsert_books(records)
+            print(f"Wrote {len(records)} books to {DB_PATH}; running workers refit on their next refresh.")
+    elif args.build_model:
+        df = load_data(CATALOG_COLUMNS)
+        if df.empty:
+            raise SystemExit("No books to build a model from. Run data_processing.py.")
+        load_recommendation_model(df, rebuild=args.force)
+        print(f"Model artifact is up to date: {model_store.read_manifest(MODEL_DIR)['version']}")
+    else:
+        import uvicorn
+
+        # The API will run on port 8000 by default
+        uvicorn.run("api:app", host="0.0.0.0", port=8000, reload=True)
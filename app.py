@@ -1,19 +1,52 @@
+import io
+import os
 import streamlit as st
 import pandas as pd
 import sqlite3
+import matplotlib
+matplotlib.use("Agg")  # Charts are rendered to PNG images, never to a window
 import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 
+from model_store import fingerprint_database
+from ranking import select_top_n
+
+DB_PATH = "books.db"
+
 # --- 1. Data Loading and Preparation (Cached for Performance) ---
+#
+# Everything derived from books.db is cached per data version, a content hash
+# of the database. The version is the only cache key, so a rerun costs two
+# os.stat calls instead of hashing the catalog, and a changed database
+# simply gets new cache entries. Each cache keeps one entry, so a new version
+# evicts the previous DataFrame and similarity matrix instead of piling up
+# (every API ingest writes books.db).
+
+@st.cache_data(show_spinner=False)
+def _database_hash(db_stats):
+    """Content hash of books.db; recomputed only when its size or mtime changes."""
+    return fingerprint_database(DB_PATH)[0]
+
+
+def data_version():
+    """The current version of books.db, cheap enough to call on every rerun."""
+    paths = [p for p in (DB_PATH, DB_PATH + "-wal") if os.path.exists(p)]
+    return _database_hash(tuple((os.path.getsize(p), os.stat(p).st_mtime_ns) for p in paths))
 
-@st.cache_data
-def load_data():
-    """Connects to the database and loads the Books table."""
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def load_data(version):
+    """
+    Connects to the database and loads the Books table.
+
+    Cached as a resource, so every rerun and session shares one DataFrame
+    instead of unpickling a copy; callers must not modify it.
+    """
     try:
-        conn = sqlite3.connect("books.db")
+        conn = sqlite3.connect(DB_PATH)
         books_df = pd.read_sql_query("SELECT * FROM Books", conn)
         conn.close()
 
@@ -37,27 +70,37 @@ def load_data():
         return pd.DataFrame()
 
 
+@st.cache_resource(show_spinner=False, max_entries=1)
+def title_options(version):
+    """Sorted unique titles for the book picker."""
+    books_df = load_data(version)
+    return [''] + sorted([str(t) for t in books_df['title'].unique().tolist() if t is not None])
+
+
 # --- 2. Phase 5 Core: Content-Based Recommendation System ---
 
-@st.cache_data
-def setup_recommendation_system(books_df):
+@st.cache_resource(show_spinner="Building the recommendation model...", max_entries=1)
+def setup_recommendation_system(version):
     """
     PHASE 5: Sets up the TF-IDF vectorizer and calculates the cosine similarity matrix.
     Content-Based Filtering is based on a combined feature set (genre + description + author).
+
+    Built once per process and data version and shared by all sessions; the
+    similarity matrix is read in place, never copied out of the cache.
     """
+    books_df = load_data(version)
     if books_df.empty:
         return None, None
 
-    # Create a combined feature string for vectorization
-    books_df['combined_features'] = books_df.apply(
-        lambda row: f"{row['genre'].replace(' ', '')} {row['description']} {row['author'].replace(' ', '')}", axis=1
-    )
+    # Create a combined feature string for vectorization (the cached catalog is left untouched)
+    combined_features = (books_df['genre'].str.replace(' ', '') + ' ' + books_df['description'] + ' '
+                         + books_df['author'].str.replace(' ', ''))
 
     # Initialize TF-IDF Vectorizer
     tfidf = TfidfVectorizer(stop_words='english', max_df=0.8)
 
     # Construct the TF-IDF matrix
-    tfidf_matrix = tfidf.fit_transform(books_df['combined_features'])
+    tfidf_matrix = tfidf.fit_transform(combined_features)
 
     # Compute the cosine similarity matrix
     cosine_sim = cosine_similarity(tfidf_matrix, tfidf_matrix)
@@ -76,23 +119,13 @@ def get_recommendations(title, books_df, cosine_sim, indices, num_recs=10):
     # Get the index of the book that matches the title
     idx = indices[title]
 
-    # Get the pairwise similarity scores of all books with that book
-    sim_scores = list(enumerate(cosine_sim[idx]))
-
-    # Sort the books based on the similarity scores
-    sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-
-    # Get the scores of the top N most similar books (excluding the input book itself)
-    sim_scores = sim_scores[1:num_recs + 1]
-
-    # Get the book indices
-    book_indices = [i[0] for i in sim_scores]
+    # Select the top N most similar books (excluding the input book itself)
+    book_indices, similarity_scores = select_top_n(cosine_sim[idx], num_recs, exclude=idx)
 
     # Return the top N most similar books with relevant metadata
-    recommendations_df = books_df.iloc[book_indices][['title', 'author', 'genre', 'rating', 'price']]
+    recommendations_df = books_df.iloc[book_indices][['title', 'author', 'genre', 'rating', 'price']].copy()
 
     # Add the similarity score for context
-    similarity_scores = [score[1] for score in sim_scores]
     recommendations_df['similarity_score'] = similarity_scores
 
     return recommendations_df
@@ -100,40 +133,63 @@ def get_recommendations(title, books_df, cosine_sim, indices, num_recs=10):
 
 # --- 3. Phase 4 Analysis Visualization Functions ---
 
-def display_analysis(books_df):
-    """Generates and displays all analysis charts (Completes Phase 4 deliverables)."""
-    st.header("Bestseller Trend Analysis")
+def figure_png(fig):
+    """Renders a matplotlib figure to PNG bytes and frees it."""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', bbox_inches='tight')
+    plt.close(fig)
+    return buffer.getvalue()
 
+
+@st.cache_data(show_spinner="Rendering charts...", max_entries=1)
+def render_analysis_charts(version):
+    """
+    Draws the analysis charts once per data version and returns them as PNG
+    images, so switching tabs or picking a book does not redraw them.
+    """
+    books_df = load_data(version)
     sns.set_style("whitegrid")
 
+    top_genres = books_df['genre'].value_counts().head(10)
+    fig1, ax1 = plt.subplots(figsize=(10, 6))
+    sns.barplot(x=top_genres.values, y=top_genres.index, palette='Spectral', ax=ax1)
+    ax1.set_xlabel('Number of Books')
+    ax1.set_ylabel('Genre')
+    plt.tight_layout()
+
+    top_authors = books_df['author'].value_counts().head(10)
+    fig2, ax2 = plt.subplots(figsize=(10, 6))
+    sns.barplot(x=top_authors.values, y=top_authors.index, palette='viridis', ax=ax2)
+    ax2.set_xlabel('Number of Bestsellers')
+    ax2.set_ylabel('Author')
+    plt.tight_layout()
+
+    fig3, ax3 = plt.subplots(figsize=(12, 5))
+    sns.histplot(books_df['rating'], bins=20, kde=True, color='#0077b6', ax=ax3)
+    ax3.set_xlabel('Rating (0.0 to 5.0)')
+    ax3.set_ylabel('Number of Books')
+
+    return {'genres': figure_png(fig1), 'authors': figure_png(fig2), 'ratings': figure_png(fig3)}
+
+
+def display_analysis(version):
+    """Displays all analysis charts (Completes Phase 4 deliverables)."""
+    st.header("Bestseller Trend Analysis")
+
+    charts = render_analysis_charts(version)
+
     col1, col2 = st.columns(2)
 
     with col1:
         st.subheader("Top 10 Bestselling Genres")
-        top_genres = books_df['genre'].value_counts().head(10)
-        fig1, ax1 = plt.subplots(figsize=(10, 6))
-        sns.barplot(x=top_genres.values, y=top_genres.index, palette='Spectral', ax=ax1)
-        ax1.set_xlabel('Number of Books')
-        ax1.set_ylabel('Genre')
-        plt.tight_layout()
-        st.pyplot(fig1)
+        st.image(charts['genres'], use_container_width=True)
 
     with col2:
         st.subheader("Top 10 Bestselling Authors")
-        top_authors = books_df['author'].value_counts().head(10)
-        fig2, ax2 = plt.subplots(figsize=(10, 6))
-        sns.barplot(x=top_authors.values, y=top_authors.index, palette='viridis', ax=ax2)
-        ax2.set_xlabel('Number of Bestsellers')
-        ax2.set_ylabel('Author')
-        plt.tight_layout()
-        st.pyplot(fig2)
+        st.image(charts['authors'], use_container_width=True)
 
     st.subheader("Distribution of Book Ratings")
-    fig3, ax3 = plt.subplots(figsize=(12, 5))
-    sns.histplot(books_df['rating'], bins=20, kde=True, color='#0077b6', ax=ax3)
-    ax3.set_xlabel('Rating (0.0 to 5.0)')
-    ax3.set_ylabel('Number of Books')
-    st.pyplot(fig3)
+    st.image(charts['ratings'], use_container_width=True)
 
 
 # --- 4. Streamlit Main App Layout (Phase 6) ---
@@ -183,13 +239,14 @@ def main():
     st.title("ReadWise: Bestseller Analysis & Smart Book Recommender")
     st.markdown("---")
 
-    books_df = load_data()
+    version = data_version()
+    books_df = load_data(version)
 
     if books_df.empty:
         return
 
     # Set up the recommendation system
-    cosine_sim, indices = setup_recommendation_system(books_df)
+    cosine_sim, indices = setup_recommendation_system(version)
 
     if cosine_sim is None:
         st.warning("Could not set up recommendation system.")
@@ -202,11 +259,9 @@ def main():
     with tab_recommender:
         st.header("Find Your Next Read")
 
-        unique_titles = sorted([str(t) for t in books_df['title'].unique().tolist() if t is not None])
-
         selected_title = st.selectbox(
             "Select a book you liked to get recommendations:",
-            options=[''] + unique_titles,
+            options=title_options(version),
             index=0
         )
 
@@ -237,7 +292,7 @@ def main():
 
     # --- Analysis Tab ---
     with tab_analysis:
-        display_analysis(books_df)
+        display_analysis(version)
 
 
 if __name__ == "__main__":
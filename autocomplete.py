@@ -0,0 +1,303 @@
+import numpy as np
+
+# Prefixes matching more entries than this are answered from precomputed top
+# lists; smaller ranges are ranked on the fly.
+PREFIX_SCAN_LIMIT = 2048
+# Suggestions precomputed per popular prefix (the largest `limit` a query can use).
+TOP_PER_PREFIX = 50
+# Minimum share of the query's trigrams a typo-tolerant match must contain,
+# and the number of postings read per query (rarest trigrams first).
+FUZZY_THRESHOLD = 0.4
+FUZZY_MAX_POSTINGS = 50_000
+
+# Entry kinds and match qualities, best first
+TITLE, AUTHOR = 0, 1
+EXACT_TITLE, TITLE_PREFIX, EXACT_AUTHOR, AUTHOR_PREFIX, FUZZY = range(5)
+MATCH_NAMES = ("exact", "prefix", "author", "author_prefix", "fuzzy")
+
+
+def trigrams(key):
+    """
+    Sorted unique trigram codes of a normalized key. The key is padded as
+    "  key " so short words and word starts get trigrams of their own; each
+    trigram packs its three code points into one int64.
+    """
+    codes = np.frombuffer(f"  {key} ".encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+    return np.unique((codes[:-2] << 42) | (codes[1:-1] << 21) | codes[2:])
+
+
+def _pack(keys):
+    """UTF-8 blob and offsets for a sorted list of byte strings."""
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum([len(key) for key in keys], out=offsets[1:])
+    return np.frombuffer(b"".join(keys), dtype=np.uint8), offsets
+
+
+# --- 1. Building the Index ---
+
+def build_index(title_keys, author_keys, reviews):
+    """
+    Builds the autocomplete arrays for a catalog, for storage in the model artifact.
+
+    `title_keys` and `author_keys` hold the normalized title and author of each
+    catalog row (None when missing), `reviews` their popularity. Every title
+    and author becomes an entry; entries are grouped under their key, keys are
+    sorted by UTF-8 bytes (code point order), and within a key titles come
+    first, most reviewed first. Returns a dict of "autocomplete_*" arrays.
+    """
+    reviews = np.asarray(reviews, dtype=np.int64)
+    rows, kinds, keys = [], [], []
+    for kind, column in ((TITLE, title_keys), (AUTHOR, author_keys)):
+        for row, key in enumerate(column):
+            if key:
+                rows.append(row)
+                kinds.append(kind)
+                keys.append(key.encode("utf-8"))
+    rows = np.array(rows, dtype=np.int32)
+    kinds = np.array(kinds, dtype=np.int8)
+
+    unique_keys, key_ids = np.unique(np.array(keys, dtype=object), return_inverse=True)
+    order = np.lexsort((-reviews[rows], kinds, key_ids))
+    rows, kinds, key_ids = rows[order], kinds[order], key_ids[order]
+    entry_offsets = np.zeros(len(unique_keys) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(key_ids, minlength=len(unique_keys)), out=entry_offsets[1:])
+    unique_keys = unique_keys.tolist()
+    key_blob, key_offsets = _pack(unique_keys)
+
+    # Trigram postings: gram code -> ids of the keys containing it
+    padded = [f"  {key.decode('utf-8')} " for key in unique_keys]
+    lengths = np.array([len(key) for key in padded], dtype=np.int64)
+    codes = np.frombuffer("".join(padded).encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+    grams = (codes[:-2] << 42) | (codes[1:-1] << 21) | codes[2:]
+    owner = np.repeat(np.arange(len(unique_keys), dtype=np.int32), lengths)[:-2]
+    position = np.arange(len(grams)) - np.repeat(np.cumsum(lengths) - lengths, lengths)[:-2]
+    valid = position < np.repeat(lengths - 2, lengths)[:-2]  # Windows inside one key
+    grams, owner = grams[valid], owner[valid]
+    order = np.lexsort((owner, grams))
+    grams, owner = grams[order], owner[order]
+    first = np.ones(len(grams), dtype=bool)  # Drop repeats of a trigram within one key
+    first[1:] = (grams[1:] != grams[:-1]) | (owner[1:] != owner[:-1])
+    grams, owner = grams[first], owner[first]
+    gram_codes, gram_counts = np.unique(grams, return_counts=True)
+    gram_offsets = np.zeros(len(gram_codes) + 1, dtype=np.int64)
+    np.cumsum(gram_counts, out=gram_offsets[1:])
+
+    top_prefixes, top_entries = _popular_prefixes(unique_keys, entry_offsets, kinds, rows, reviews)
+    top_blob, top_offsets = _pack(top_prefixes)
+    return {
+        "autocomplete_n_rows": np.array([len(reviews)], dtype=np.int64),
+        "autocomplete_key_blob": key_blob,
+        "autocomplete_key_offsets": key_offsets,
+        "autocomplete_entry_offsets": entry_offsets,
+        "autocomplete_entry_rows": rows,
+        "autocomplete_entry_kinds": kinds,
+        "autocomplete_gram_codes": gram_codes,
+        "autocomplete_gram_offsets": gram_offsets,
+        "autocomplete_gram_keys": owner,
+        "autocomplete_top_blob": top_blob,
+        "autocomplete_top_offsets": top_offsets,
+        "autocomplete_top_entries": top_entries,
+    }
+
+
+def _popular_prefixes(keys, entry_offsets, kinds, rows, reviews):
+    """
+    Walks the prefix tree of the sorted keys and, for every prefix matching
+    more than PREFIX_SCAN_LIMIT entries, stores its best TOP_PER_PREFIX
+    entries: title matches before author matches, then by reviews.
+    """
+    rank = kinds.astype(np.int64) * (int(reviews.max(initial=0)) + 1) - reviews[rows]
+    prefixes, tops = [], []
+    stack = [(b"", 0, len(keys))]
+    while stack:
+        prefix, lo, hi = stack.pop()
+        start, end = entry_offsets[lo], entry_offsets[hi]
+        if prefix:
+            if end - start <= PREFIX_SCAN_LIMIT:
+                continue
+            candidates = start + np.argpartition(rank[start:end], 4 * TOP_PER_PREFIX)[:4 * TOP_PER_PREFIX]
+            candidates = candidates[np.argsort(rank[candidates], kind="stable")]
+            _, first = np.unique(rows[candidates], return_index=True)
+            best = candidates[np.sort(first)][:TOP_PER_PREFIX]
+            prefixes.append(prefix)
+            tops.append(np.pad(best, (0, TOP_PER_PREFIX - len(best)), constant_values=-1))
+
+        # Children: one range per next byte
+        depth = len(prefix)
+        position = lo
+        while position < hi:
+            key = keys[position]
+            if len(key) == depth:
+                position += 1
+                continue
+            child = prefix + key[depth:depth + 1]
+            child_hi = _bisect(keys, child + b"\xff", position, hi)
+            stack.append((child, position, child_hi))
+            position = child_hi
+
+    order = sorted(range(len(prefixes)), key=prefixes.__getitem__)
+    top_entries = np.array([tops[i] for i in order], dtype=np.int64).reshape(len(order), TOP_PER_PREFIX)
+    return [prefixes[i] for i in order], top_entries
+
+
+def _bisect(keys, target, lo, hi):
+    """First position in keys[lo:hi] whose key is >= target."""
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if keys[mid] < target:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+# --- 2. Querying the Index ---
+
+class AutocompleteIndex:
+    """
+    Prefix and typo-tolerant title/author search over the arrays written by
+    build_index, which may be memory-mapped.
+
+    Keys stay packed in a byte blob and are binary-searched in place, so
+    opening the index costs nothing and a prefix lookup is O(log N). Books
+    added after the index was built are passed to search() as `extra` and
+    scanned directly until the next full refit.
+    """
+
+    def __init__(self, arrays):
+        self.n_rows = int(arrays["autocomplete_n_rows"][0])
+        self.key_blob = arrays["autocomplete_key_blob"]
+        self.key_offsets = arrays["autocomplete_key_offsets"]
+        self.entry_offsets = arrays["autocomplete_entry_offsets"]
+        self.entry_rows = arrays["autocomplete_entry_rows"]
+        self.entry_kinds = arrays["autocomplete_entry_kinds"]
+        self.gram_codes = arrays["autocomplete_gram_codes"]
+        self.gram_offsets = arrays["autocomplete_gram_offsets"]
+        self.gram_keys = arrays["autocomplete_gram_keys"]
+        self.top_blob = arrays["autocomplete_top_blob"]
+        self.top_offsets = arrays["autocomplete_top_offsets"]
+        self.top_entries = arrays["autocomplete_top_entries"]
+
+    @staticmethod
+    def _lower_bound(blob, offsets, target, lo=0):
+        """First key index in the packed (blob, offsets) list that is >= target."""
+        hi = len(offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if blob[offsets[mid]:offsets[mid + 1]].tobytes() < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _key(self, i):
+        return self.key_blob[self.key_offsets[i]:self.key_offsets[i + 1]].tobytes()
+
+    def _prefix_entries(self, query):
+        """Entries whose key starts with `query`, and where exact matches end."""
+        lo = self._lower_bound(self.key_blob, self.key_offsets, query)
+        hi = self._lower_bound(self.key_blob, self.key_offsets, query + b"\xff", lo)
+        if lo == hi:
+            return np.empty(0, dtype=np.int64), 0
+        start, end = int(self.entry_offsets[lo]), int(self.entry_offsets[hi])
+        exact_end = int(self.entry_offsets[lo + 1]) if self._key(lo) == query else start
+        exact = np.arange(start, min(exact_end, start + TOP_PER_PREFIX))
+
+        if end - start <= PREFIX_SCAN_LIMIT:
+            entries = np.arange(start, end)
+        else:
+            i = self._lower_bound(self.top_blob, self.top_offsets, query)
+            top = self.top_entries[i] if i < len(self.top_offsets) - 1 and \
+                self.top_blob[self.top_offsets[i]:self.top_offsets[i + 1]].tobytes() == query else ()
+            entries = np.asarray(top, dtype=np.int64)
+            entries = entries[entries >= 0]
+        return np.concatenate([exact, entries]), exact_end
+
+    def _fuzzy_keys(self, query_key, limit, reviews):
+        """
+        Keys containing at least FUZZY_THRESHOLD of the query's trigrams, as
+        (key ids, similarities). Containment rather than Jaccard similarity is
+        used because the query is usually a partial title.
+        """
+        codes = trigrams(query_key)
+        if not len(self.gram_codes):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        found = np.minimum(np.searchsorted(self.gram_codes, codes), len(self.gram_codes) - 1)
+        found = found[self.gram_codes[found] == codes]
+        if not len(found):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        lengths = self.gram_offsets[found + 1] - self.gram_offsets[found]
+        order = np.argsort(lengths, kind="stable")
+        chosen = order[:max(1, np.searchsorted(np.cumsum(lengths[order]), FUZZY_MAX_POSTINGS, side="right"))]
+        postings = np.concatenate([
+            self.gram_keys[self.gram_offsets[g]:self.gram_offsets[g + 1]] for g in found[chosen]
+        ])
+        keys, shared = np.unique(postings, return_counts=True)
+        similarity = shared / len(codes)
+        good = similarity >= FUZZY_THRESHOLD
+        keys, similarity = keys[good], similarity[good]
+        popularity = np.asarray(reviews)[self.entry_rows[self.entry_offsets[keys]]]
+        best = np.lexsort((-popularity, -similarity))[:limit]
+        return keys[best], similarity[best]
+
+    def search(self, query_key, limit, reviews, extra=()):
+        """
+        Returns up to `limit` suggestions for a normalized query as
+        (row, match name, score) tuples, best first.
+
+        Ranking is by match quality (exact title, title prefix, exact author,
+        author prefix, typo-tolerant match), then similarity for fuzzy
+        matches, then popularity from `reviews` (current review counts by
+        row). `extra` holds (title key, author key, row) for books that are
+        not in the index yet.
+        """
+        query = query_key.encode("utf-8")
+        entries, exact_end = self._prefix_entries(query)
+        kinds = self.entry_kinds[entries]
+        rows = [self.entry_rows[entries].astype(np.int64)]
+        quality = [np.where(entries < exact_end,
+                            np.where(kinds == TITLE, EXACT_TITLE, EXACT_AUTHOR),
+                            np.where(kinds == TITLE, TITLE_PREFIX, AUTHOR_PREFIX))]
+        scores = [np.ones(len(entries))]
+
+        if len(set(rows[0].tolist())) < limit and len(query_key) >= 3:
+            keys, similarity = self._fuzzy_keys(query_key, limit, reviews)
+            for key, sim in zip(keys, similarity):
+                start = self.entry_offsets[key]
+                matched = self.entry_rows[start:min(self.entry_offsets[key + 1], start + limit)]
+                rows.append(matched.astype(np.int64))
+                quality.append(np.full(len(matched), FUZZY))
+                scores.append(np.full(len(matched), sim))
+
+        for title_key, author_key, row in extra:
+            for kind, key in ((TITLE, title_key), (AUTHOR, author_key)):
+                if not key:
+                    continue
+                if key.startswith(query_key):
+                    match = (EXACT_TITLE if key == query_key else TITLE_PREFIX) if kind == TITLE \
+                        else (EXACT_AUTHOR if key == query_key else AUTHOR_PREFIX)
+                    sim = 1.0
+                elif len(query_key) >= 3:
+                    codes = trigrams(query_key)
+                    sim = len(np.intersect1d(codes, trigrams(key), assume_unique=True)) / len(codes)
+                    if sim < FUZZY_THRESHOLD:
+                        continue
+                    match = FUZZY
+                else:
+                    continue
+                rows.append(np.array([row]))
+                quality.append(np.array([match]))
+                scores.append(np.array([sim]))
+
+        rows, quality, scores = np.concatenate(rows), np.concatenate(quality), np.concatenate(scores)
+        order = np.lexsort((-np.asarray(reviews)[rows], -scores, quality))
+        results, seen = [], set()
+        for i in order:
+            row = int(rows[i])
+            if row not in seen:
+                seen.add(row)
+                results.append((row, MATCH_NAMES[quality[i]], round(float(scores[i]), 4)))
+                if len(results) == limit:
+                    break
+        return results
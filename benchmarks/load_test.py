@@ -0,0 +1,134 @@
+"""
+Latency under concurrency, with CPU work on the compute pool vs. on the event loop.
+
+Starts the API with uvicorn in a subprocess over a synthetic catalog (response
+cache disabled) and drives it over HTTP with a mixed workload: heavy requests
+(batch recommendations, free-text queries) interleaved with light ones
+(autocomplete, title pages). Runs once with COMPUTE_THREADS=0 (everything on
+the event loop) and once with the pool, and reports p50/p99 latency per
+request class and concurrency level, plus the number of 503s.
+
+    python benchmarks/load_test.py [--books 20000] [--requests 400] [--concurrency 1,8,32,64]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import synthetic_books, write_database
+
+HEAVY_SHARE = 0.2
+
+
+def make_requests(titles, n_requests, seed=0):
+    """A reproducible mix of (class, method, url, json body) requests."""
+    rng = np.random.default_rng(seed)
+    requests = []
+    for _ in range(n_requests):
+        if rng.random() < HEAVY_SHARE:
+            if rng.random() < 0.5:
+                body = {"titles": rng.choice(titles, 50).tolist(), "num_recs": 10}
+                requests.append(("heavy", "POST", "/recommendations/batch", body))
+            else:
+                words = " ".join(rng.choice(rng.choice(titles).lower().split()[:3], 2))
+                requests.append(("heavy", "GET", f"/recommendations/query?q={words}&num_recs=20", None))
+        elif rng.random() < 0.5:
+            requests.append(("light", "GET", f"/autocomplete?q={rng.choice(titles)[:4]}", None))
+        else:
+            requests.append(("light", "GET", "/titles?limit=20", None))
+    return requests
+
+
+def start_server(workdir, compute_threads):
+    """Starts uvicorn in `workdir` (where books.db lives) and waits until it answers."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    env = dict(os.environ, PYTHONPATH=ROOT, COMPUTE_THREADS=str(compute_threads),
+               RESPONSE_CACHE_SIZE="0", REFIT_INTERVAL_SECONDS="0", MODEL_DIR=os.path.join(workdir, "model"))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(600):
+        try:
+            if httpx.get(f"{url}/titles?limit=1").status_code == 200:
+                return server, url
+        except httpx.TransportError:
+            pass
+        time.sleep(0.5)
+    server.kill()
+    raise RuntimeError("API did not start")
+
+
+async def run_load(url, requests, concurrency):
+    latencies = {"light": [], "heavy": []}
+    rejected = 0
+    queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+
+    async def worker(client):
+        nonlocal rejected
+        while not queue.empty():
+            kind, method, path, body = queue.get_nowait()
+            start = time.perf_counter()
+            response = await client.request(method, path, json=body)
+            latencies[kind].append(time.perf_counter() - start)
+            rejected += response.status_code == 503
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=120) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+
+    def percentile(values, q):
+        return round(float(np.percentile(values, q)) * 1e3, 2) if values else None
+
+    return {
+        "concurrency": concurrency,
+        **{f"{kind}_p{q}_ms": percentile(values, q) for kind, values in latencies.items() for q in (50, 99)},
+        "rejected_503": rejected,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--books", type=int, default=20_000)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", default="1,8,32,64")
+    parser.add_argument("--threads", type=int, default=min(8, os.cpu_count() or 1),
+                        help="COMPUTE_THREADS for the pooled run")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        books = synthetic_books(args.books)
+        write_database(books, os.path.join(workdir, "books.db"))
+        requests = make_requests(books['title'].to_numpy(), args.requests)
+
+        for mode, threads in (("event_loop", 0), ("compute_pool", args.threads)):
+            server, url = start_server(workdir, threads)
+            try:
+                results[mode] = [asyncio.run(run_load(url, requests, int(c))) for c in args.concurrency.split(",")]
+            finally:
+                server.terminate()
+                server.wait()
+
+    print(json.dumps({"books": args.books, "requests": args.requests, "compute_threads": args.threads,
+                      "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
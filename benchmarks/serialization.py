@@ -0,0 +1,90 @@
+"""
+Serialization cost of a recommendation response, per 100 results.
+
+Compares the old path (DataFrame slice, iterrows, one Book model per row,
+response_model validation, JSON encoding) with the columnar path
+(RecommendationModel.build_book_list and FastJSONResponse).
+
+    python benchmarks/serialization.py [--books 100000] [--repeat 200]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from pydantic import TypeAdapter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import api
+from benchmarks.synthetic import synthetic_books
+
+RESULTS = 100
+
+
+def legacy_response(books_df, book_indices, sim_scores):
+    """The serialization path before the columnar change, kept for comparison."""
+    recommendations_df = books_df.iloc[book_indices].copy()
+    recommendations_df['similarity_score'] = sim_scores
+    results = []
+    for _, row in recommendations_df.iterrows():
+        results.append(api.Book(
+            title=row['title'],
+            author=row['author'],
+            genre=row['genre'],
+            price=float(row.get('price', 0.0)),
+            rating=float(row.get('rating', 0.0)),
+            reviews=int(row.get('reviews', 0)),
+            similarity_score=float(row['similarity_score'])
+        ))
+    response = api.RecommendationResponse(book_title="x", recommendations=results)
+    # FastAPI validates and dumps the returned model again through response_model
+    adapter = TypeAdapter(api.RecommendationResponse)
+    content = adapter.dump_python(adapter.validate_python(response), mode="json")
+    return json.dumps(content).encode("utf-8")
+
+
+def columnar_response(model, book_indices, sim_scores):
+    recommendations = model.build_book_list(book_indices, sim_scores)
+    return api.FastJSONResponse(api.recommendation_body(recommendations, book_title="x")).body
+
+
+def time_per_call(function, repeat):
+    function()  # Warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--books", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    books_df = synthetic_books(args.books)
+    model = api.RecommendationModel(
+        api.catalog_columns(books_df), None, None, np.empty((0, 0), np.int32), np.empty((0, 0), np.float32),
+        db_hash="benchmark", version="benchmark", title_lookup={}
+    )
+    rng = np.random.default_rng(0)
+    book_indices = rng.choice(args.books, size=RESULTS, replace=False)
+    sim_scores = np.sort(rng.random(RESULTS, dtype=np.float32))[::-1]
+
+    legacy = time_per_call(lambda: legacy_response(books_df, book_indices, sim_scores), args.repeat)
+    columnar = time_per_call(lambda: columnar_response(model, book_indices, sim_scores), args.repeat)
+    print(json.dumps({
+        "books": args.books,
+        "results_per_response": RESULTS,
+        "orjson": api.orjson is not None,
+        "legacy_ms_per_100": round(legacy * 1e3, 3),
+        "columnar_ms_per_100": round(columnar * 1e3, 3),
+        "speedup": round(legacy / columnar, 1),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Import and startup cost of an API worker in each serving mode, with results as JSON.
+
+Builds a model artifact for a synthetic catalog once, then for each
+SERVING_MODE starts fresh interpreters that time:
+
+  import     `import api`, and the heavy libraries it has loaded
+  startup    refresh_model(): reading the catalog and mapping the artifact
+  first_*    the first title and free-text recommendations, which include
+             any lazy loading they trigger
+
+with resident memory after each step. Run from the repository root:
+
+    python benchmarks/startup.py [--books 20000] [--runs 5] [--output startup.json]
+
+Set SIMILARITY_BACKEND=ivf for catalogs much larger than the default, whose
+exact neighbor index takes long to build.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = ("full", "lean")
+# Modules whose import dominates worker start-up
+HEAVY_MODULES = ("pandas", "scipy", "sklearn", "uvicorn")
+
+
+def resident_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+# --- 1. Steps (each run in its own process) ---
+
+def build_artifact(workdir, n_books):
+    """Writes the synthetic catalog to books.db and builds its model artifact."""
+    from benchmarks.synthetic import synthetic_books, write_database
+    import api
+
+    api.DB_PATH = os.path.join(workdir, "books.db")
+    api.MODEL_DIR = os.path.join(workdir, "model")
+    write_database(synthetic_books(n_books), api.DB_PATH)
+    api.load_recommendation_model(api.load_data(api.CATALOG_COLUMNS))
+    return {"books": n_books}
+
+
+def measure_worker(workdir):
+    """One worker start in the SERVING_MODE of the environment."""
+    start = time.perf_counter()
+    import api
+    result = {
+        "import_seconds": round(time.perf_counter() - start, 4),
+        "rss_after_import_bytes": resident_bytes(),
+        "modules_after_import": [name for name in HEAVY_MODULES if name in sys.modules],
+    }
+
+    api.DB_PATH = os.path.join(workdir, "books.db")
+    api.MODEL_DIR = os.path.join(workdir, "model")
+    start = time.perf_counter()
+    api.refresh_model()
+    result["startup_seconds"] = round(time.perf_counter() - start, 4)
+    result["rss_after_startup_bytes"] = resident_bytes()
+    result["modules_after_startup"] = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    model = api.model
+    title = next(title for title in model.columns['title'] if title)
+    start = time.perf_counter()
+    api.get_recommendations_logic(model, model.find_books(title)[0])
+    result["first_title_seconds"] = round(time.perf_counter() - start, 4)
+    start = time.perf_counter()
+    api.get_query_recommendations_logic(model, " ".join(title.split()[:2]))
+    result["first_query_seconds"] = round(time.perf_counter() - start, 4)
+    result["rss_after_first_query_bytes"] = resident_bytes()
+    result["modules_after_first_query"] = [name for name in HEAVY_MODULES if name in sys.modules]
+    return result
+
+
+# --- 2. Driver ---
+
+def run_step(step, workdir, n_books, mode="full"):
+    env = dict(os.environ, REFIT_INTERVAL_SECONDS="0", SERVING_MODE=mode)
+    command = [sys.executable, os.path.abspath(__file__), "--step", step, "--workdir", workdir, "--books", str(n_books)]
+    completed = subprocess.run(command, env=env, cwd=ROOT, stdout=subprocess.PIPE, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+
+def summarize(runs):
+    """Median of every numeric field over the runs; other fields from the first run."""
+    summary = {}
+    for key, value in runs[0].items():
+        summary[key] = median([run[key] for run in runs]) if isinstance(value, (int, float)) else value
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--books", type=int, default=20_000)
+    parser.add_argument("--runs", type=int, default=5, help="Worker starts per mode; medians are reported")
+    parser.add_argument("--output", help="Write the results to this JSON file (default: stdout)")
+    parser.add_argument("--step", choices=["build", "worker"], help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.step:
+        result = build_artifact(args.workdir, args.books) if args.step == "build" else measure_worker(args.workdir)
+        print(json.dumps(result))
+        return
+
+    report = {"books": args.books, "runs": args.runs, "modes": {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"Building the model artifact for {args.books} books...", file=sys.stderr)
+        run_step("build", workdir, args.books)
+        for mode in MODES:
+            print(f"Starting {args.runs} {mode} workers...", file=sys.stderr)
+            runs = [run_step("worker", workdir, args.books, mode) for _ in range(args.runs)]
+            report["modes"][mode] = summarize(runs)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+Scaling benchmark over synthetic catalogs, with results as JSON.
+
+For each catalog size it runs these stages, each in a fresh process so peak
+memory is its own:
+
+  generate   write a reproducible synthetic catalog (benchmarks/synthetic.py)
+             as vendor CSV files
+  etl        data_processing.run_etl throughput into a new books.db
+  build      model artifact build time (setup_recommendation_model, then the
+             whole artifact) and peak RSS
+  endpoints  artifact load time, then latency percentiles and throughput of
+             each endpoint through an in-process ASGI client, response cache off
+
+    python benchmarks/suite.py [--sizes 10000,100000,1000000] [--output results.json]
+    python benchmarks/suite.py --compare before.json after.json
+
+Catalogs above EXACT_MAX_BOOKS use the ivf backend unless --backend is given:
+the exact neighbor index holds N*K entries, but building it takes time
+growing with N^2 (about 22 s at 20k books, many hours at 1M).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows: peak memory is not reported
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import synthetic_books, write_vendor_csvs
+
+STAGES = ("generate", "etl", "build", "endpoints")
+
+# Largest catalog benchmarked with the exact backend by default; larger ones use ivf
+EXACT_MAX_BOOKS = 100_000
+# Relative change beyond which --compare flags a metric
+REGRESSION_THRESHOLD = 0.10
+# Result fields that --compare treats as measurements (the rest are counts and settings)
+METRIC_SUFFIXES = ("_seconds", "_ms", "_bytes", "per_second", "recall_at_k")
+
+
+def peak_rss_bytes():
+    """
+    Peak resident memory of this process so far. On Linux this is VmHWM,
+    because ru_maxrss carries over the parent's peak across fork and exec.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# --- 1. Stages (each run in its own process) ---
+
+def run_generate_stage(workdir, n_books):
+    start = time.perf_counter()
+    paths = write_vendor_csvs(synthetic_books(n_books), os.path.join(workdir, "data"))
+    return {"files": len(paths), "seconds": round(time.perf_counter() - start, 3)}
+
+
+def run_etl_stage(workdir, n_books):
+    import data_processing
+
+    stats = data_processing.run_etl(os.path.join(workdir, "data"), os.path.join(workdir, "books.db"))
+    return {**stats, "peak_rss_bytes": peak_rss_bytes()}
+
+
+def run_build_stage(workdir, n_books):
+    import api
+    import model_store
+
+    api.DB_PATH = os.path.join(workdir, "books.db")
+    api.MODEL_DIR = os.path.join(workdir, "model")
+    df = api.load_data()
+    rss_before = peak_rss_bytes()
+    db_hash, db_stats = model_store.fingerprint_database(api.DB_PATH)
+    api.build_model_artifact(df, db_hash, db_stats)
+    manifest = model_store.read_manifest(api.MODEL_DIR)
+    return {
+        "books": manifest["n_books"],
+        "backend": manifest["params"]["backend"],
+        "fit_seconds": manifest["fit_seconds"],
+        "build_seconds": manifest["build_seconds"],
+        "tfidf_shape": manifest["tfidf_shape"],
+        "recall_at_k": manifest.get("recall_at_k"),
+        "peak_rss_bytes": peak_rss_bytes(),
+        "peak_rss_before_build_bytes": rss_before,
+    }
+
+
+def endpoint_requests(books_df, n_requests, seed=0):
+    """Reproducible (method, url, json body) requests for each benchmarked endpoint."""
+    rng = np.random.default_rng(seed)
+    titles = books_df['title'].to_numpy()
+    picks = rng.choice(titles, n_requests)
+    words = [title.lower().split()[:2] for title in rng.choice(titles, n_requests)]
+    genres = books_df['genre'].value_counts().index
+    return {
+        "title": [("GET", f"/recommendations/title/{t}", None) for t in picks],
+        "title_filtered": [("GET", f"/recommendations/title/{t}?genre={genres[i % len(genres)]}&min_rating=4", None)
+                           for i, t in enumerate(picks)],
+        "query": [("GET", f"/recommendations/query?q={' '.join(w)}", None) for w in words],
+        "batch_20": [("POST", "/recommendations/batch", {"titles": rng.choice(titles, 20).tolist()})
+                     for _ in range(max(1, n_requests // 10))],
+        "titles_page": [("GET", f"/titles?limit=100&prefix={t[:2]}", None) for t in picks],
+        "autocomplete": [("GET", f"/autocomplete?q={t[:4]}", None) for t in picks],
+        "analysis": [("GET", "/analysis/data", None) for _ in range(n_requests)],
+        "search": [("GET", f"/search?q={' '.join(w)}", None) for w in words],
+        "search_listing": [("GET", f"/search?genre={genres[i % len(genres)]}&min_rating=4.5", None)
+                           for i in range(n_requests)],
+    }
+
+
+async def time_endpoints(app, requests):
+    import httpx
+
+    results = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark") as client:
+        for name, calls in requests.items():
+            method, url, body = calls[0]
+            await client.request(method, url, json=body)  # Warm up lazily built state
+            latencies = []
+            statuses = {}
+            start = time.perf_counter()
+            for method, url, body in calls:
+                request_start = time.perf_counter()
+                response = await client.request(method, url, json=body)
+                latencies.append(time.perf_counter() - request_start)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            elapsed = time.perf_counter() - start
+            results[name] = {
+                "requests": len(calls),
+                "p50_ms": round(float(np.percentile(latencies, 50)) * 1e3, 3),
+                "p95_ms": round(float(np.percentile(latencies, 95)) * 1e3, 3),
+                "p99_ms": round(float(np.percentile(latencies, 99)) * 1e3, 3),
+                "requests_per_second": round(len(calls) / elapsed, 1),
+                "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+            }
+    return results
+
+
+def run_endpoints_stage(workdir, n_books, n_requests):
+    import api
+    import cache
+
+    api.DB_PATH = os.path.join(workdir, "books.db")
+    api.MODEL_DIR = os.path.join(workdir, "model")
+    api.response_cache = cache.ResponseCache(max_entries=0)
+    start = time.perf_counter()
+    api.refresh_model()
+    load_seconds = time.perf_counter() - start
+    rss_loaded = peak_rss_bytes()
+
+    requests = endpoint_requests(api.model.books_df, n_requests)
+    return {
+        "load_seconds": round(load_seconds, 3),
+        "rss_after_load_bytes": rss_loaded,
+        "model_bytes": api.model.memory_usage(),
+        "endpoints": asyncio.run(time_endpoints(api.app, requests)),
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+
+# --- 2. Driver ---
+
+def run_stage_process(stage, workdir, n_books, backend, args):
+    """
+    Runs one stage in a fresh interpreter and returns its JSON result (the
+    last stdout line), or {"error": ...} if the stage crashed or was killed,
+    e.g. by the out-of-memory killer.
+    """
+    env = dict(os.environ, REFIT_INTERVAL_SECONDS="0", SIMILARITY_BACKEND=backend)
+    command = [sys.executable, os.path.abspath(__file__), "--stage", stage, "--workdir", workdir,
+               "--sizes", str(n_books), "--requests", str(args.requests)]
+    completed = subprocess.run(command, env=env, stdout=subprocess.PIPE, text=True)
+    if completed.returncode != 0:
+        reason = (f"killed by signal {-completed.returncode}" if completed.returncode < 0
+                  else f"exited with status {completed.returncode}")
+        return {"error": reason}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    import pandas as pd
+    import scipy
+    import sklearn
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "scipy": scipy.__version__,
+        "sklearn": sklearn.__version__,
+    }
+
+
+def flatten(results, prefix=""):
+    """Numeric leaves of a result tree as {"10000.build.fit_seconds": value}."""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(before_path, after_path):
+    """Prints every metric present in both files with its relative change, flagging regressions."""
+    with open(before_path) as f:
+        before = flatten(json.load(f)["results"])
+    with open(after_path) as f:
+        after = flatten(json.load(f)["results"])
+    for name in sorted(before.keys() & after.keys()):
+        old, new = before[name], after[name]
+        if old == 0 or not name.endswith(METRIC_SUFFIXES):
+            continue
+        change = (new - old) / old
+        # Throughput should go up; time and memory should go down
+        worse = -change if name.endswith(("per_second", "recall_at_k")) else change
+        flag = "  REGRESSION" if worse > REGRESSION_THRESHOLD else ""
+        print(f"{name:60s} {old:>14,.3f} {new:>14,.3f} {change:+8.1%}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated catalog sizes")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint")
+    parser.add_argument("--backend", default=os.environ.get("SIMILARITY_BACKEND"), choices=["exact", "ivf"],
+                        help=f"Similarity backend (default: exact up to {EXACT_MAX_BOOKS} books, ivf above)")
+    parser.add_argument("--output", help="Write the results to this JSON file (default: stdout)")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="Compare two result files")
+    parser.add_argument("--stage", choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    if args.stage:
+        runners = {
+            "generate": lambda: run_generate_stage(args.workdir, sizes[0]),
+            "etl": lambda: run_etl_stage(args.workdir, sizes[0]),
+            "build": lambda: run_build_stage(args.workdir, sizes[0]),
+            "endpoints": lambda: run_endpoints_stage(args.workdir, sizes[0], args.requests),
+        }
+        print(json.dumps(runners[args.stage]()))
+        return
+
+    report = {"environment": environment(), "backend": args.backend or "auto", "results": {}}
+    for n_books in sizes:
+        with tempfile.TemporaryDirectory() as workdir:
+            backend = args.backend or ("exact" if n_books <= EXACT_MAX_BOOKS else "ivf")
+            print(f"Benchmarking {n_books} books ({backend} backend)...", file=sys.stderr)
+            results = {"backend": backend}
+            for stage in STAGES:
+                results[stage] = run_stage_process(stage, workdir, n_books, backend, args)
+                if "error" in results[stage]:
+                    print(f"  {stage} stage failed ({results[stage]['error']}); skipping the rest", file=sys.stderr)
+                    break
+            report["results"][str(n_books)] = results
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
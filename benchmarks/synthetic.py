@@ -0,0 +1,126 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+GENRES = ['Fiction', 'Non-Fiction', 'Science Fiction', 'Young Adult', 'Self-Help', 'Mystery', 'Fantasy', 'History']
+WORDS = (
+    "love war space time magic secret history world dark light city journey family dream "
+    "mind life death king queen star ocean river mountain shadow fire ice heart stone code "
+    "money habit power leader science nature island garden winter summer ghost detective"
+).split()
+
+# Description vocabulary: pseudo-words drawn with a Zipf-like frequency, so
+# the TF-IDF matrix has a few very common terms and a long tail of rare ones
+VOCABULARY_SIZE = 20_000
+SYLLABLES = "ka lo mi ne ru sa ti vo ze ba de fi go hu ja ko li mu no pa re si to ve wa".split()
+
+# Each book has one of N_TOPICS topics; TOPIC_SHARE of its description words
+# come from that topic's own frequent terms, the rest from the shared ranking
+N_TOPICS = 256
+TOPIC_SHARE = 0.4
+
+# Description length in words: log-normal with this median, clipped to the range
+DESCRIPTION_MEDIAN_WORDS = 90
+DESCRIPTION_WORDS_RANGE = (10, 400)
+
+# Vendor CSV column names understood by data_processing.column_mapping
+VENDOR_COLUMNS = {
+    'title': 'Name', 'author': 'Author', 'rating': 'User Rating', 'reviews': 'Reviews',
+    'price': 'Price', 'genre': 'Genre', 'description': 'Description',
+}
+
+
+def zipf_weights(n, exponent=1.1):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def vocabulary(size=VOCABULARY_SIZE):
+    """
+    `size` distinct pseudo-words of two to four syllables in a fixed random
+    order (the order is the frequency rank), the same on every run.
+    """
+    rng = np.random.default_rng(1)
+    words = set(WORDS)
+    while len(words) < size:
+        n_syllables = rng.integers(2, 5)
+        words.add("".join(rng.choice(SYLLABLES, n_syllables)))
+    return rng.permutation(sorted(words)).tolist()
+
+
+def synthetic_books(n_books, seed=0):
+    """
+    A catalog of `n_books` with the columns of the Books table.
+
+    Genres and authors are skewed like a real bestseller list (a few genres
+    and prolific authors cover most books), descriptions have a log-normal
+    length around DESCRIPTION_MEDIAN_WORDS words from a Zipf-distributed
+    vocabulary with topic clusters, and reviews are heavy-tailed. The same seed always gives the
+    same catalog.
+    """
+    rng = np.random.default_rng(seed)
+    words = np.array(WORDS)
+    n_authors = max(1, n_books // 5)
+
+    title_words = words[rng.integers(0, len(words), size=(n_books, 3))]
+    titles = [f"{' '.join(row)} {i}".title() for i, row in enumerate(title_words)]
+
+    terms = vocabulary()
+    lengths = np.clip(rng.lognormal(np.log(DESCRIPTION_MEDIAN_WORDS), 0.6, size=n_books).astype(int),
+                      *DESCRIPTION_WORDS_RANGE)
+    term_ids = rng.choice(len(terms), size=int(lengths.sum()), p=zipf_weights(len(terms)))
+    # Topic words: the same Zipf ranks, shifted to a region of the vocabulary owned by the topic
+    topics = np.repeat(rng.integers(0, N_TOPICS, size=n_books), lengths)
+    from_topic = rng.random(len(term_ids)) < TOPIC_SHARE
+    term_ids[from_topic] = (term_ids[from_topic] + topics[from_topic] * (len(terms) // N_TOPICS)) % len(terms)
+    ends = np.cumsum(lengths)
+    descriptions = [" ".join(map(terms.__getitem__, term_ids[end - length:end].tolist()))
+                    for end, length in zip(ends, lengths)]
+
+    # Author ranks follow a Zipf-like law: author 0 writes the most books
+    author_ids = rng.choice(n_authors, size=n_books, p=zipf_weights(n_authors, 0.8))
+    return pd.DataFrame({
+        'title': titles,
+        'author': [f"Author {i}" for i in author_ids],
+        'genre': np.array(GENRES)[rng.choice(len(GENRES), size=n_books, p=zipf_weights(len(GENRES), 0.8))],
+        'price': rng.lognormal(np.log(12), 0.5, size=n_books).round(2),
+        'rating': np.clip(rng.normal(4.4, 0.3, size=n_books), 1, 5).round(1),
+        'reviews': np.minimum(rng.pareto(1.2, size=n_books) * 200, 500_000).astype(np.int64),
+        'description': descriptions,
+    })
+
+
+def write_database(books_df, db_path):
+    """Writes a catalog to a fresh books.db with the schema used by data_processing.py."""
+    import data_processing
+
+    conn = data_processing.open_database(db_path)
+    try:
+        with conn:
+            conn.execute("DELETE FROM Books")
+            conn.executemany(
+                "INSERT INTO Books (title, author, genre, price, rating, reviews, description) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                books_df[data_processing.BOOK_COLUMNS].astype(object).itertuples(index=False, name=None)
+            )
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+
+
+def write_vendor_csvs(books_df, folder, rows_per_file=100_000):
+    """
+    Writes a catalog as vendor CSV files for data_processing.run_etl: vendor
+    column names and reviews with thousands separators, split into files of
+    at most `rows_per_file` rows. Returns the file paths.
+    """
+    os.makedirs(folder, exist_ok=True)
+    vendor = books_df.rename(columns=VENDOR_COLUMNS)
+    vendor['Reviews'] = [f"{n:,}" for n in books_df['reviews']]
+    paths = []
+    for i, start in enumerate(range(0, len(vendor), rows_per_file)):
+        path = os.path.join(folder, f"dataset_{i:03d}.csv")
+        vendor.iloc[start:start + rows_per_file].to_csv(path, index=False)
+        paths.append(path)
+    return paths
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def key_digest(key):
+    """Stable hex digest of a JSON-serialisable key, identical in every process."""
+    data = json.dumps(key, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+# --- 1. In-Process Cache ---
+
+class LRUCache:
+    """
+    A thread-safe LRU cache with a per-entry time to live.
+
+    Holds at most `max_entries` values; the least recently used one is evicted
+    first. Entries older than `ttl_seconds` are treated as missing (0 disables
+    expiry).
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached value, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires and expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.max_entries <= 0:
+            return
+        expires = time.monotonic() + self.ttl_seconds if self.ttl_seconds else 0
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# --- 2. Shared Cache ---
+
+class SQLiteCache:
+    """
+    A cache of JSON values in a local SQLite file, so several uvicorn workers
+    on one machine share warm entries without an external service.
+
+    Each thread gets its own connection. Expired rows are skipped on read and
+    pruned when the table grows past `max_entries`.
+    """
+
+    def __init__(self, path, max_entries=100_000, ttl_seconds=300):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires REAL)"
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        try:
+            row = self._connect().execute(
+                "SELECT value FROM cache WHERE key = ? AND (expires = 0 OR expires >= ?)",
+                (key, time.time())
+            ).fetchone()
+        except sqlite3.Error:
+            return None  # A busy or broken cache file is just a miss
+        return None if row is None else json.loads(row[0])
+
+    def set(self, key, value):
+        expires = time.time() + self.ttl_seconds if self.ttl_seconds else 0
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), expires)
+                )
+                self._writes += 1
+                if self._writes % 1000 == 0:
+                    self._prune(conn)
+        except sqlite3.Error:
+            pass
+
+    def _prune(self, conn):
+        """Drops expired rows, then the oldest-expiring ones beyond max_entries."""
+        conn.execute("DELETE FROM cache WHERE expires != 0 AND expires < ?", (time.time(),))
+        conn.execute(
+            "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache")
+
+
+# --- 3. Response Cache ---
+
+class ResponseCache:
+    """
+    Two-level cache for JSON responses: the in-process LRU first, then the
+    optional shared SQLite cache, whose hits are copied into the LRU.
+
+    Keys are tuples; callers include the model version in them, so entries
+    from an older model are never served and simply age out.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=300, shared_path=None):
+        self.ttl_seconds = ttl_seconds
+        self.local = LRUCache(max_entries, ttl_seconds)
+        self.shared = SQLiteCache(shared_path, ttl_seconds=ttl_seconds) if shared_path else None
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        if self.shared is not None:
+            value = self.shared.get(key_digest(key))
+            if value is not None:
+                self.shared_hits += 1
+                self.local.set(key, value)
+                return value
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key_digest(key), value)
+
+    def clear(self):
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self):
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "entries": len(self.local),
+            "max_entries": self.local.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "shared": self.shared is not None,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+        }
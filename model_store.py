@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: builds are not serialised between workers
+    fcntl = None
+
+# Bump when the layout of the saved arrays changes, so old artifacts are rebuilt.
+ARTIFACT_FORMAT_VERSION = 4
+
+# --- 1. Data Version ---
+
+def fingerprint_database(db_path, manifest=None):
+    """
+    Returns a content hash of the SQLite database (and its WAL file, if any).
+
+    Hashing a large database takes a while, so when the file size and
+    modification time match the ones recorded in `manifest` the stored hash
+    is reused instead of reading the file again.
+    """
+    paths = [p for p in (db_path, db_path + "-wal") if os.path.exists(p)]
+    stats = [[os.path.getsize(p), os.stat(p).st_mtime_ns] for p in paths]
+
+    if manifest and manifest.get("db_stats") == stats:
+        return manifest["db_hash"], stats
+
+    digest = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest(), stats
+
+
+# --- 2. String Columns ---
+
+def encode_strings(strings):
+    """
+    Packs a list of strings into a UTF-8 byte blob plus an offsets array, so
+    text (vocabulary terms, titles) can be stored as memory-mappable .npy files.
+    """
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def decode_strings(blob, offsets):
+    """Inverse of encode_strings."""
+    data = bytes(blob)
+    offsets = offsets.tolist()
+    if data.isascii():
+        # One character per byte: decode once and slice the str
+        text = data.decode("ascii")
+        return [text[start:end] for start, end in zip(offsets, offsets[1:])]
+    return [data[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+
+
+# --- 3. Reading and Writing Artifacts ---
+
+def _current_dir(artifact_dir):
+    """Returns the directory the CURRENT pointer refers to, or None."""
+    try:
+        with open(os.path.join(artifact_dir, "CURRENT")) as f:
+            return os.path.join(artifact_dir, f.read().strip())
+    except FileNotFoundError:
+        return None
+
+
+def _read_manifest_in(version_dir):
+    try:
+        with open(os.path.join(version_dir, "manifest.json")) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def read_manifest(artifact_dir):
+    """Returns the manifest of the current artifact, or None if there is none."""
+    current = _current_dir(artifact_dir)
+    return None if current is None else _read_manifest_in(current)
+
+
+def is_current(manifest, db_hash, params):
+    """True if the artifact was built from this database version with these parameters."""
+    return (
+        manifest is not None
+        and manifest.get("format_version") == ARTIFACT_FORMAT_VERSION
+        and manifest.get("db_hash") == db_hash
+        and manifest.get("params") == params
+    )
+
+
+def save_model(artifact_dir, arrays, manifest):
+    """
+    Writes a model artifact and makes it the current one.
+
+    Every array is saved as its own .npy file so it can be memory-mapped. The
+    artifact is written to a fresh version directory and published by
+    atomically replacing the CURRENT pointer, so readers never observe a
+    half-written model. Older versions are removed afterwards; processes that
+    still map them keep their pages until they drop the model.
+    """
+    os.makedirs(artifact_dir, exist_ok=True)
+    version = f"{manifest['db_hash']}-{time.time_ns()}"
+    version_dir = os.path.join(artifact_dir, version)
+    os.makedirs(version_dir)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(version_dir, f"{name}.npy"), np.ascontiguousarray(array))
+
+    manifest = dict(manifest, format_version=ARTIFACT_FORMAT_VERSION, version=version, arrays=sorted(arrays))
+    with open(os.path.join(version_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    pointer = os.path.join(artifact_dir, "CURRENT")
+    with open(pointer + ".tmp", "w") as f:
+        f.write(version)
+    os.replace(pointer + ".tmp", pointer)
+
+    for entry in os.listdir(artifact_dir):
+        path = os.path.join(artifact_dir, entry)
+        if entry != version and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+    return manifest
+
+
+def load_model(artifact_dir, mmap_mode="r"):
+    """
+    Opens the current artifact and returns (arrays, manifest).
+
+    Arrays are memory-mapped read-only by default, so loading is independent
+    of catalog size and all workers on a machine share one copy of the pages
+    through the OS page cache.
+    """
+    current = _current_dir(artifact_dir)
+    manifest = None if current is None else _read_manifest_in(current)
+    if manifest is None:
+        raise FileNotFoundError(f"No model artifact found in '{artifact_dir}'.")
+
+    arrays = {
+        name: np.load(os.path.join(current, f"{name}.npy"), mmap_mode=mmap_mode)
+        for name in manifest["arrays"]
+    }
+    return arrays, manifest
+
+
+@contextmanager
+def build_lock(artifact_dir):
+    """Serialises artifact builds between worker processes on the same machine."""
+    os.makedirs(artifact_dir, exist_ok=True)
+    with open(os.path.join(artifact_dir, ".lock"), "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,32 @@
+import numpy as np
+
+
+def select_top_n(scores, n, exclude=None):
+    """
+    Returns the ids and values of the n highest scores, best first.
+
+    `scores` holds one row of scores per query (a 1-D array is a single query).
+    `exclude` optionally gives one column id per row to leave out, typically
+    the query book itself. np.argpartition finds the n winners in O(N) and
+    only those are sorted, instead of sorting every catalog item.
+    """
+    scores = np.asarray(scores)
+    single = scores.ndim == 1
+    scores = np.atleast_2d(scores)
+
+    # Partition the negated scores: selecting the smallest values stays fast
+    # even when most scores tie at zero, which is common for sparse TF-IDF.
+    negated = -scores
+    if exclude is not None:
+        negated[np.arange(scores.shape[0]), np.atleast_1d(exclude)] = np.inf
+    n = max(0, min(n, scores.shape[1] - (exclude is not None)))
+
+    top = np.argpartition(negated, n - 1, axis=1)[:, :n] if n else np.empty((scores.shape[0], 0), dtype=np.intp)
+    top_scores = -np.take_along_axis(negated, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+    if single:
+        return top[0], top_scores[0]
+    return top, top_scores
@@ -0,0 +1,414 @@
+import os
+import re
+
+import numpy as np
+
+from ranking import select_top_n
+
+# Upper bound on the number of similarity scores held in memory at once while
+# building the neighbor index. Ranking a block takes about 16 bytes per score
+# (the float32 scores, their negated copy and the int64 positions from
+# argpartition), so 2**22 scores peak near 70 MB.
+SIMILARITY_BLOCK_ELEMENTS = int(os.environ.get("SIMILARITY_BLOCK_ELEMENTS", 2**22))
+# Blocks of at most this many query rows are scored as dense columns, a sparse
+# mat-vec each; larger blocks (the neighbor index of a small catalog) are
+# faster as one sparse x sparse product, which shares work between rows.
+DENSE_QUERY_ROWS = 64
+# IVF settings: nlist=0 picks 4 * sqrt(N) cells.
+IVF_PARAMS = {
+    "nlist": int(os.environ.get("IVF_NLIST", 0)),
+    "nprobe": int(os.environ.get("IVF_NPROBE", 16)),
+    "dims": int(os.environ.get("IVF_DIMS", 256)),
+    "iterations": int(os.environ.get("IVF_ITERATIONS", 10)),
+    "train_size": int(os.environ.get("IVF_TRAIN_SIZE", 50000)),
+    "seed": 0,
+}
+
+# --- 1. Scoring ---
+
+def score_rows(matrix, query_rows):
+    """Dense scores of every row of `matrix` against each of `query_rows` (one row per query)."""
+    n_queries, n_terms = query_rows.shape
+    if n_queries <= DENSE_QUERY_ROWS and n_queries * n_terms <= SIMILARITY_BLOCK_ELEMENTS:
+        return (matrix @ query_rows.T.toarray()).T
+    return (matrix @ query_rows.T).T.toarray()
+
+
+def _normalize_rows(matrix):
+    """L2-normalises the rows of a dense matrix, leaving all-zero rows untouched."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def splice_rows(matrix, rows, vectors):
+    """
+    Returns CSR `matrix` with row rows[i] replaced by row i of `vectors` and
+    the remaining rows of `vectors` appended, in that order. The unchanged
+    rows are copied as contiguous runs of the data and index arrays, so
+    this costs one memory copy of the matrix plus the changed rows.
+    """
+    from scipy.sparse import csr_matrix
+
+    n_replaced = len(rows)
+    lengths = np.concatenate([np.diff(matrix.indptr), np.diff(vectors.indptr)[n_replaced:]])
+    lengths[rows] = np.diff(vectors.indptr)[:n_replaced]
+    indptr = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+
+    data, indices = [], []
+    previous = 0
+    for i in np.argsort(rows, kind='stable').tolist():
+        row = int(rows[i])
+        for parts, old, new in ((data, matrix.data, vectors.data), (indices, matrix.indices, vectors.indices)):
+            parts.append(old[matrix.indptr[previous]:matrix.indptr[row]])
+            parts.append(new[vectors.indptr[i]:vectors.indptr[i + 1]])
+        previous = row + 1
+    for parts, old, new in ((data, matrix.data, vectors.data), (indices, matrix.indices, vectors.indices)):
+        parts.append(old[matrix.indptr[previous]:])
+        parts.append(new[vectors.indptr[n_replaced]:])
+
+    index_dtype = np.int32 if indptr[-1] <= np.iinfo(np.int32).max else np.int64
+    return csr_matrix(
+        (np.concatenate(data).astype(matrix.dtype, copy=False), np.concatenate(indices).astype(index_dtype, copy=False),
+         indptr.astype(index_dtype)),
+        shape=(len(lengths), matrix.shape[1])
+    )
+
+
+# --- 2. Similarity Backends ---
+
+class SimilarityBackend:
+    """
+    Nearest-neighbor search over L2-normalised TF-IDF vectors.
+
+    `query` accepts any batch of TF-IDF rows, catalog books or text that was
+    never in the catalog, and returns the top-k catalog ids and cosine scores
+    per row, best first. An optional boolean `mask` over the catalog limits
+    the search to the rows where it is True. Rows with fewer than k
+    candidates are padded with id -1. `state` returns the extra arrays stored in the model artifact and
+    `load` restores the backend from them.
+    """
+    name = None
+
+    def __init__(self, tfidf_matrix):
+        self.tfidf_matrix = tfidf_matrix
+
+    @classmethod
+    def build(cls, tfidf_matrix):
+        return cls(tfidf_matrix)
+
+    @classmethod
+    def load(cls, tfidf_matrix, arrays):
+        return cls(tfidf_matrix)
+
+    def state(self):
+        return {}
+
+    def with_rows(self, tfidf_matrix, rows):
+        """Returns a backend over an updated TF-IDF matrix in which `rows` are new or changed."""
+        return type(self)(tfidf_matrix)
+
+    def query(self, query_rows, k, exclude=None, mask=None):
+        raise NotImplementedError
+
+    def neighbor_index(self, k):
+        """Top-k neighbors of every catalog book; a book is never its own neighbor."""
+        n_books = self.tfidf_matrix.shape[0]
+        return self.query(self.tfidf_matrix, k, exclude=np.arange(n_books))
+
+
+class ExactSimilarityBackend(SimilarityBackend):
+    """Scores every catalog book: exact results, cost linear in catalog size."""
+    name = "exact"
+
+    def query(self, query_rows, k, exclude=None, mask=None):
+        """
+        Queries are scored in blocks so that at most SIMILARITY_BLOCK_ELEMENTS
+        scores exist at any time; the full N x N matrix is never allocated.
+        `exclude` optionally gives one catalog id per query to leave out. With
+        a `mask`, disallowed books are set to -inf before top-N selection.
+        """
+        if mask is not None:
+            return self._query_masked(query_rows, k, exclude, mask)
+
+        n_queries, n_books = query_rows.shape[0], self.tfidf_matrix.shape[0]
+        k = max(0, min(k, n_books - (exclude is not None)))
+        ids = np.empty((n_queries, k), dtype=np.int32)
+        scores = np.empty((n_queries, k), dtype=np.float32)
+        if k == 0 or n_queries == 0:
+            return ids, scores
+
+        block_size = max(1, SIMILARITY_BLOCK_ELEMENTS // n_books)
+        for start in range(0, n_queries, block_size):
+            stop = min(start + block_size, n_queries)
+            block = score_rows(self.tfidf_matrix, query_rows[start:stop])
+            block_exclude = None if exclude is None else exclude[start:stop]
+            ids[start:stop], scores[start:stop] = select_top_n(block, k, exclude=block_exclude)
+
+        return ids, scores
+
+    def _query_masked(self, query_rows, k, exclude, mask):
+        """query() restricted to the catalog rows where `mask` is set, applied during top-N selection."""
+        n_queries, n_books = query_rows.shape[0], self.tfidf_matrix.shape[0]
+        k = max(0, min(k, np.count_nonzero(mask)))
+        ids = np.full((n_queries, k), -1, dtype=np.int32)
+        scores = np.full((n_queries, k), -np.inf, dtype=np.float32)
+        if k == 0 or n_queries == 0:
+            return ids, scores
+
+        disallowed = ~mask
+        block_size = max(1, SIMILARITY_BLOCK_ELEMENTS // n_books)
+        for start in range(0, n_queries, block_size):
+            stop = min(start + block_size, n_queries)
+            block = score_rows(self.tfidf_matrix, query_rows[start:stop])
+            np.copyto(block, -np.inf, where=disallowed)
+            if exclude is not None:
+                block[np.arange(stop - start), exclude[start:stop]] = -np.inf
+            top, top_scores = select_top_n(block, k)
+            ids[start:stop] = np.where(np.isfinite(top_scores), top, -1)
+            scores[start:stop] = top_scores
+
+        return ids, scores
+
+
+class IVFSimilarityBackend(SimilarityBackend):
+    """
+    Approximate search with an inverted-file (IVF) index, in pure NumPy.
+
+    TF-IDF rows are reduced to IVF_PARAMS["dims"] dense dimensions with a
+    count-sketch random projection and clustered into `nlist` cells with
+    spherical k-means. A query only scores the books in the `nprobe` cells
+    nearest to it, using the exact TF-IDF vectors. Raising nprobe buys recall
+    with latency; lowering iterations or train_size buys build time with recall.
+    """
+    name = "ivf"
+
+    def __init__(self, tfidf_matrix, projection_dims, projection_signs, centroids, list_ids, list_offsets):
+        from scipy.sparse import csr_matrix
+
+        super().__init__(tfidf_matrix)
+        n_terms = len(projection_dims)
+        self.projection = csr_matrix(
+            (projection_signs, (np.arange(n_terms), projection_dims)),
+            shape=(n_terms, centroids.shape[1])
+        )
+        self.projection_dims = projection_dims
+        self.projection_signs = projection_signs
+        self.centroids = centroids
+        self.list_ids = list_ids
+        self.list_offsets = list_offsets
+
+    @classmethod
+    def build(cls, tfidf_matrix):
+        from scipy.sparse import csr_matrix
+
+        params = IVF_PARAMS
+        n_books, n_terms = tfidf_matrix.shape
+        rng = np.random.default_rng(params["seed"])
+        projection_dims = rng.integers(0, params["dims"], n_terms).astype(np.int32)
+        projection_signs = rng.choice(np.array([-1.0, 1.0], dtype=np.float32), n_terms)
+        backend = cls(tfidf_matrix, projection_dims, projection_signs,
+                      np.empty((0, params["dims"]), dtype=np.float32),
+                      np.empty(0, dtype=np.int32), np.zeros(1, dtype=np.int64))
+
+        reduced = backend._reduce(tfidf_matrix)
+        nlist = min(n_books, params["nlist"] or max(1, int(4 * np.sqrt(n_books))))
+        train = reduced[rng.choice(n_books, min(n_books, params["train_size"]), replace=False)]
+        centroids = train[rng.choice(len(train), nlist, replace=False)].copy()
+
+        # Spherical k-means: assign to the closest centroid, re-centre, renormalise
+        for _ in range(params["iterations"]):
+            assign = cls._nearest(train, centroids)
+            members = csr_matrix(
+                (np.ones(len(train), dtype=np.float32), (assign, np.arange(len(train)))),
+                shape=(nlist, len(train))
+            )
+            sums = np.asarray(members @ train)
+            filled = np.bincount(assign, minlength=nlist) > 0
+            centroids[filled] = _normalize_rows(sums[filled])
+
+        assign = cls._nearest(reduced, centroids)
+        backend.centroids = centroids
+        backend.list_ids = np.argsort(assign, kind='stable').astype(np.int32)
+        backend.list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))])
+        return backend
+
+    @classmethod
+    def load(cls, tfidf_matrix, arrays):
+        return cls(tfidf_matrix, arrays["ivf_projection_dims"], arrays["ivf_projection_signs"],
+                   arrays["ivf_centroids"], arrays["ivf_list_ids"], arrays["ivf_list_offsets"])
+
+    def state(self):
+        return {
+            "ivf_projection_dims": self.projection_dims,
+            "ivf_projection_signs": self.projection_signs,
+            "ivf_centroids": self.centroids,
+            "ivf_list_ids": self.list_ids,
+            "ivf_list_offsets": self.list_offsets,
+        }
+
+    def with_rows(self, tfidf_matrix, rows):
+        """Keeps the trained cells and only (re)assigns `rows` to their nearest cell."""
+        nlist = len(self.centroids)
+        cells = np.empty(tfidf_matrix.shape[0], dtype=np.int64)
+        cells[self.list_ids] = np.repeat(np.arange(nlist), np.diff(self.list_offsets))
+        cells[rows] = self._nearest(self._reduce(tfidf_matrix[rows]), self.centroids)
+        return type(self)(
+            tfidf_matrix, self.projection_dims, self.projection_signs, self.centroids,
+            np.argsort(cells, kind='stable').astype(np.int32),
+            np.concatenate([[0], np.cumsum(np.bincount(cells, minlength=nlist))])
+        )
+
+    def _reduce(self, rows):
+        return _normalize_rows(np.asarray((rows @ self.projection).todense(), dtype=np.float32))
+
+    @staticmethod
+    def _nearest(vectors, centroids):
+        """Index of the closest centroid for each vector, computed in blocks."""
+        block_size = max(1, SIMILARITY_BLOCK_ELEMENTS // len(centroids))
+        return np.concatenate([
+            (vectors[start:start + block_size] @ centroids.T).argmax(axis=1)
+            for start in range(0, len(vectors), block_size)
+        ])
+
+    def _cell(self, cell):
+        return self.list_ids[self.list_offsets[cell]:self.list_offsets[cell + 1]]
+
+    def query(self, query_rows, k, exclude=None, mask=None):
+        """
+        Without a mask, scores the books of the nprobe cells nearest to each
+        query. With one, a filter that leaves fewer books than nprobe cells
+        hold is scored exactly; otherwise further cells are probed, nearest
+        first, until k allowed books match or every cell has been scored, so
+        a selective filter does not come back short.
+        """
+        n_queries, n_books = query_rows.shape[0], self.tfidf_matrix.shape[0]
+        k = max(0, min(k, n_books - (exclude is not None)))
+        ids = np.full((n_queries, k), -1, dtype=np.int32)
+        scores = np.full((n_queries, k), -np.inf, dtype=np.float32)
+        if k == 0 or n_queries == 0:
+            return ids, scores
+
+        nprobe = min(IVF_PARAMS["nprobe"], len(self.centroids))
+        cell_scores = self._reduce(query_rows) @ self.centroids.T
+        if mask is None:
+            probes, _ = select_top_n(cell_scores, nprobe)
+        else:
+            allowed = np.flatnonzero(mask).astype(np.int32)
+            exact = len(allowed) <= nprobe * n_books / len(self.centroids)
+            probes = np.argsort(-cell_scores, axis=1, kind='stable')
+
+        for i in range(n_queries):
+            if mask is not None and exact:
+                cells = [allowed]
+            else:
+                # Generated lazily: most queries stop after the first nprobe cells
+                cells = (np.concatenate([self._cell(cell) for cell in probes[i, start:start + nprobe]])
+                         for start in range(0, probes.shape[1], nprobe))
+            parts, part_scores, matched = [], [], 0
+            for candidates in cells:
+                if exclude is not None:
+                    candidates = candidates[candidates != exclude[i]]
+                if mask is not None:
+                    candidates = candidates[mask[candidates]]
+                cand_scores = score_rows(self.tfidf_matrix[candidates], query_rows[i]).ravel()
+                parts.append(candidates)
+                part_scores.append(cand_scores)
+                matched += np.count_nonzero(cand_scores > 0)
+                if mask is None or matched >= k:
+                    break
+            candidates, cand_scores = np.concatenate(parts), np.concatenate(part_scores)
+            top, top_scores = select_top_n(cand_scores, k)
+            ids[i, :len(top)] = candidates[top]
+            scores[i, :len(top)] = top_scores
+
+        return ids, scores
+
+    def neighbor_index(self, k):
+        """
+        Builds the index cell by cell: every book in a cell is scored against
+        the books of the nprobe cells closest to that cell, in one sparse
+        product per block of books instead of one query per book.
+        """
+        n_books = self.tfidf_matrix.shape[0]
+        k = max(0, min(k, n_books - 1))
+        ids = np.full((n_books, k), -1, dtype=np.int32)
+        scores = np.full((n_books, k), -np.inf, dtype=np.float32)
+        if k == 0:
+            return ids, scores
+
+        nprobe = min(IVF_PARAMS["nprobe"], len(self.centroids))
+        cell_probes, _ = select_top_n(self.centroids @ self.centroids.T, nprobe)
+        for cell in range(len(self.centroids)):
+            members = self._cell(cell)
+            if len(members) == 0:
+                continue
+            candidates = np.concatenate([self._cell(probe) for probe in cell_probes[cell]])
+            candidate_matrix = self.tfidf_matrix[candidates]
+            block_size = max(1, SIMILARITY_BLOCK_ELEMENTS // len(candidates))
+            for start in range(0, len(members), block_size):
+                rows = members[start:start + block_size]
+                # Candidate matrices are small, so densifying the rows would cost more than it saves
+                block = (candidate_matrix @ self.tfidf_matrix[rows].T).T.toarray()
+                block[rows[:, None] == candidates[None, :]] = -np.inf  # Never its own neighbor
+                top, top_scores = select_top_n(block, k)
+                found = np.isfinite(top_scores)
+                ids[rows, :top.shape[1]] = np.where(found, candidates[top], -1)
+                scores[rows, :top.shape[1]] = top_scores
+
+        return ids, scores
+
+
+SIMILARITY_BACKENDS = {backend.name: backend for backend in (ExactSimilarityBackend, IVFSimilarityBackend)}
+
+
+def estimate_recall(backend, neighbor_ids, sample_size=200, seed=0):
+    """Recall@K of an approximate neighbor index against exact search, on a sample of books."""
+    n_books, k = neighbor_ids.shape
+    sample = np.random.default_rng(seed).choice(n_books, min(n_books, sample_size), replace=False)
+    exact_ids, _ = ExactSimilarityBackend(backend.tfidf_matrix).query(
+        backend.tfidf_matrix[sample], k, exclude=sample
+    )
+    hits = [len(np.intersect1d(exact_ids[i], neighbor_ids[row])) for i, row in enumerate(sample)]
+    return float(np.sum(hits) / max(1, exact_ids.size))
+
+
+# --- 3. Query Vectorizer ---
+
+class QueryVectorizer:
+    """
+    The transform of the fitted TfidfVectorizer, from the artifact's
+    vocabulary and idf weights, in NumPy and the standard library: workers
+    vectorize free-text queries and ingested books without importing
+    scikit-learn. Text is lowercased and split with the vectorizer's default
+    token pattern; stop words are never in the fitted vocabulary, so
+    dropping unknown words drops them too. The vectors equal
+    TfidfVectorizer.transform's, counts times idf over the L2 norm in float64.
+    """
+    TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+    def __init__(self, terms, idf):
+        self.vocabulary = {term: col for col, term in enumerate(terms)}
+        self.idf = np.asarray(idf, dtype=np.float64)
+
+    def transform(self, documents):
+        """TF-IDF rows of `documents` as a float64 CSR matrix with sorted indices."""
+        from scipy.sparse import csr_matrix
+
+        indptr, indices, counts = [0], [], []
+        for document in documents:
+            row = {}
+            for token in self.TOKEN_PATTERN.findall(document.lower()):
+                col = self.vocabulary.get(token)
+                if col is not None:
+                    row[col] = row.get(col, 0) + 1
+            for col in sorted(row):
+                indices.append(col)
+                counts.append(row[col])
+            indptr.append(len(indices))
+
+        n_rows = len(indptr) - 1
+        indices = np.array(indices, dtype=np.int32)
+        values = np.array(counts, dtype=np.float64) * self.idf[indices]
+        rows = np.repeat(np.arange(n_rows), np.diff(indptr))
+        values /= np.sqrt(np.bincount(rows, weights=values * values, minlength=n_rows))[rows]
+        return csr_matrix((values, indices, np.array(indptr, dtype=np.int32)), shape=(n_rows, len(self.vocabulary)))
@@ -0,0 +1,134 @@
+"""
+Incremental ingest (RecommendationModel.with_books) against a full rebuild.
+
+The rebuild vectorizes every book with the model's fitted vocabulary and
+recomputes the neighbor index exactly; a real refit would also refit the
+idf weights, so it is not comparable row for row. Run from the repository
+root with `python -m pytest tests`.
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix, random as sparse_random
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import api
+import similarity
+from benchmarks.synthetic import synthetic_books
+
+N_BOOKS = 600
+N_ADDED = 20
+
+
+@pytest.fixture(scope="module")
+def books():
+    books = synthetic_books(N_BOOKS)
+    books['book_id'] = np.arange(1, N_BOOKS + 1)
+    return books
+
+
+@pytest.fixture(autouse=True)
+def exact_backend(monkeypatch):
+    monkeypatch.setattr(api, "SIMILARITY_BACKEND", "exact")
+
+
+def build_model(books):
+    """A model fitted on `books`, as load_recommendation_model builds it (without the artifact)."""
+    tfidf, tfidf_matrix, backend, neighbor_ids, neighbor_scores = api.setup_recommendation_model(books)
+    return api.RecommendationModel(
+        api.catalog_columns(api.compact_catalog(books)), tfidf_matrix, backend, neighbor_ids, neighbor_scores,
+        db_hash="test", version="test", vectorizer=tfidf
+    )
+
+
+def ingest_records(books):
+    """`books` as ingest_books passes them to with_books."""
+    records = api.clean_books(books[list(api.BookIn.model_fields)].copy()).reset_index(drop=True)
+    records['book_id'] = books['book_id'].to_numpy()
+    return records
+
+
+def rebuild(model, books):
+    """The TF-IDF rows and exact neighbor index of `books` with the model's fitted vocabulary."""
+    tfidf_matrix = model.vectorizer.transform(api.combine_features(books)).astype(np.float32)
+    return tfidf_matrix, similarity.ExactSimilarityBackend(tfidf_matrix).neighbor_index(model.neighbor_ids.shape[1])
+
+
+def neighbor_sets(ids, scores, row):
+    """The neighbors of `row` scoring above its last one (ties at the end may be broken either way)."""
+    return set(ids[row][scores[row] > scores[row, -1]].tolist())
+
+
+def test_splice_rows_matches_dense_splice():
+    dense = sparse_random(50, 30, density=0.2, dtype=np.float32, random_state=0).toarray()
+    dense[10] = 0  # An empty row
+    matrix = csr_matrix(dense)
+    vectors = sparse_random(5, 30, density=0.3, format='csr', dtype=np.float32, random_state=1)
+
+    for rows in (np.array([7, 0, 49, 10]), np.array([], dtype=np.int64)):
+        expected = matrix.toarray()
+        expected[rows] = vectors.toarray()[:len(rows)]
+        expected = np.vstack([expected, vectors.toarray()[len(rows):]])
+
+        spliced = similarity.splice_rows(matrix, rows, vectors)
+        assert spliced.shape == expected.shape
+        np.testing.assert_array_equal(spliced.toarray(), expected)
+        assert spliced.indptr[-1] == spliced.nnz
+
+
+def test_added_books_match_rebuild(books):
+    base = build_model(books.iloc[:N_BOOKS - N_ADDED].reset_index(drop=True))
+    model = base.with_books(ingest_records(books.iloc[N_BOOKS - N_ADDED:]))
+    tfidf_matrix, (expected_ids, expected_scores) = rebuild(base, books)
+
+    assert model.n_books == N_BOOKS
+    expected_catalog = api.catalog_columns(api.compact_catalog(books))
+    for name, values in model.columns.items():
+        np.testing.assert_array_equal(values, expected_catalog[name])
+    np.testing.assert_allclose(model.tfidf_matrix.toarray(), tfidf_matrix.toarray(), rtol=1e-6, atol=1e-7)
+
+    np.testing.assert_allclose(model.neighbor_scores, expected_scores, rtol=1e-5, atol=1e-6)
+    for row in range(N_BOOKS):
+        assert neighbor_sets(model.neighbor_ids, model.neighbor_scores, row) == \
+            neighbor_sets(expected_ids, expected_scores, row)
+    assert model.find_books(books['title'].iloc[-1]) == (N_BOOKS - 1,)
+
+
+def test_updated_books_match_rebuild_except_stale_lists(books):
+    base = build_model(books)
+    updated_rows = np.array([3, 250])
+    changed = books.iloc[updated_rows].copy()
+    # New descriptions taken from unrelated books, so the neighbors really change
+    changed['description'] = books['description'].iloc[[500, 100]].to_numpy()
+    changed['rating'] = 2.5
+    model = base.with_books(ingest_records(changed))
+
+    updated_books = books.copy()
+    updated_books.loc[updated_rows, ['description', 'rating']] = changed[['description', 'rating']].to_numpy()
+    tfidf_matrix, (expected_ids, expected_scores) = rebuild(base, updated_books)
+
+    assert model.n_books == N_BOOKS
+    assert model.columns['rating'][updated_rows].tolist() == [2.5, 2.5]
+    np.testing.assert_array_equal(model.columns['book_id'], base.columns['book_id'])
+    np.testing.assert_allclose(model.tfidf_matrix.toarray(), tfidf_matrix.toarray(), rtol=1e-6, atol=1e-7)
+
+    # Lists that held an updated book are approximate until the next full refit
+    stale = np.isin(base.neighbor_ids, updated_rows).any(axis=1)
+    stale[updated_rows] = False
+    assert stale.any()
+    for row in range(N_BOOKS):
+        if stale[row]:
+            ids, scores = model.neighbor_ids[row], model.neighbor_scores[row]
+            found = ids >= 0
+            # Every listed score is the true similarity, and no slot beats the exact list
+            true_scores = (tfidf_matrix[ids[found]] @ tfidf_matrix[row].T).toarray().ravel()
+            np.testing.assert_allclose(scores[found], true_scores, rtol=1e-5, atol=1e-6)
+            assert np.all(scores[found] <= expected_scores[row][found] + 1e-6)
+        else:
+            np.testing.assert_allclose(model.neighbor_scores[row], expected_scores[row], rtol=1e-5, atol=1e-6)
+            assert neighbor_sets(model.neighbor_ids, model.neighbor_scores, row) == \
+                neighbor_sets(expected_ids, expected_scores, row)